@@ -0,0 +1,166 @@
+## Process-wide Postgres connection pool for the MCP SQL executor
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+import psycopg2
+import psycopg2.errors
+from psycopg2 import pool as pg_pool
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+AUGUR_POOL_MIN = int(os.getenv("AUGUR_POOL_MIN", "1"))
+AUGUR_POOL_MAX = int(os.getenv("AUGUR_POOL_MAX", "10"))
+# Seconds a tool call waits for a free connection before giving up
+AUGUR_POOL_TIMEOUT = float(os.getenv("AUGUR_POOL_TIMEOUT", "30"))
+# Connections idle longer than this are pinged before being handed out
+AUGUR_POOL_CHECK_AFTER = float(os.getenv("AUGUR_POOL_CHECK_AFTER", "30"))
+
+# Every pooled session is pinned to augur_data and can only read
+SESSION_OPTIONS = "-c search_path=augur_data -c default_transaction_read_only=on"
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, minconn: int = AUGUR_POOL_MIN, maxconn: int = AUGUR_POOL_MAX,
+                 timeout: float = AUGUR_POOL_TIMEOUT, check_after: float = AUGUR_POOL_CHECK_AFTER):
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_after = check_after
+        self._pool = pg_pool.ThreadedConnectionPool(
+            minconn, maxconn,
+            dbname=os.getenv("AUGUR_DB", "augur"),
+            user=os.getenv("AUGUR_USER", "your_db_user"),
+            password=os.getenv("AUGUR_PASSWORD", "your_db_password"),
+            host=os.getenv("AUGUR_HOST", "localhost"),
+            port=os.getenv("AUGUR_PORT", "5432"),
+            options=SESSION_OPTIONS,
+        )
+        # ThreadedConnectionPool raises instead of blocking when exhausted, so gate it with a semaphore
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._last_used = {}
+        self.in_use = 0
+        self.acquired = 0
+        self.discarded = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is None or time.monotonic() - last_used < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        self._pool.putconn(conn, close=True)
+        with self._lock:
+            self.discarded += 1
+
+    def acquire(self):
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise PoolTimeout(f"No database connection available after {self.timeout:.0f}s "
+                              f"({self.maxconn} connections in use)")
+        waited = time.monotonic() - start
+        try:
+            conn = self._pool.getconn()
+            while not self._healthy(conn):
+                logger.warning("Discarding broken pooled database connection")
+                self._discard(conn)
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.in_use += 1
+            self.acquired += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return conn
+
+    def release(self, conn, broken: bool = False):
+        try:
+            if not broken and not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            if broken or conn.closed:
+                self._discard(conn)
+            else:
+                self._pool.putconn(conn)
+                # psycopg2 only keeps minconn idle connections and closes the rest
+                if conn.closed:
+                    self._last_used.pop(id(conn), None)
+                else:
+                    self._last_used[id(conn)] = time.monotonic()
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except psycopg2.errors.QueryCanceled:
+            # statement_timeout cancels the query, not the session; release() rolls it back
+            raise
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.release(conn, broken)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max": self.maxconn,
+                "in_use": self.in_use,
+                "idle": len(self._pool._pool),
+                "acquired": self.acquired,
+                "discarded": self.discarded,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": 1000 * self.wait_seconds / self.acquired if self.acquired else 0.0,
+                "max_wait_ms": 1000 * self.max_wait_seconds,
+            }
+
+    def close(self):
+        self._pool.closeall()
+
+
+# Created on first use so importing the MCP server doesn't require a reachable database
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+    return _pool
+
+def pool_stats() -> dict:
+    return _pool.stats() if _pool is not None else {"max": AUGUR_POOL_MAX, "in_use": 0, "idle": 0}
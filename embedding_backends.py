@@ -0,0 +1,72 @@
+## Embedding backends - a common interface for the Ollama client and an offline in-process vectorizer
+
+import os
+import re
+import threading
+import time
+from typing import List
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS, HashingVectorizer
+from metrics import EMBEDDING_CALLS, EMBEDDING_SECONDS, EMBEDDING_TEXTS
+from tracing import span
+from dotenv import load_dotenv
+load_dotenv()
+
+HASHING_EMBED_DIM = int(os.getenv("HASHING_EMBED_DIM", "1024"))
+
+
+class Embedder:
+    # Recorded in every embedding store header next to the model; see schema_rag.load_embedding_store
+    backend = None
+
+    def __init__(self, model: str):
+        self.model = model
+        self._stats_lock = threading.Lock()
+        self.texts_embedded = 0
+        self.seconds = 0.0
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        start = time.perf_counter()
+        with span("embedding", backend=self.backend, texts=len(texts)):
+            vectors = self._embed(texts)
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self.texts_embedded += len(texts)
+            self.seconds += elapsed
+        EMBEDDING_CALLS.inc(backend=self.backend)
+        EMBEDDING_TEXTS.inc(len(texts), backend=self.backend)
+        EMBEDDING_SECONDS.observe(elapsed, backend=self.backend)
+        return vectors
+
+    def throughput(self) -> float:
+        with self._stats_lock:
+            return self.texts_embedded / self.seconds if self.seconds else 0.0
+
+    def close(self):
+        pass
+
+
+# Words, word bigrams and character trigrams hashed into a fixed number of dimensions. Stateless, so
+# nothing is fitted or saved, and identifiers like repo_group_id still overlap with "repo group"
+class HashingEmbedder(Embedder):
+    backend = "hashing"
+
+    def __init__(self, dim: int = HASHING_EMBED_DIM):
+        # The feature set is part of the name, so changing it refuses stores built with the old one
+        super().__init__(f"word-char-ngram-v1-{dim}")
+        self.dim = dim
+        self.vectorizer = HashingVectorizer(analyzer=self.features, n_features=dim, norm="l2")
+
+    @staticmethod
+    def features(text: str) -> List[str]:
+        words = [w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in ENGLISH_STOP_WORDS]
+        bigrams = [f"{a} {b}" for a, b in zip(words, words[1:])]
+        trigrams = [f"#{padded[i:i + 3]}" for w in words for padded in [f"<{w}>"] for i in range(len(padded) - 2)]
+        return words + bigrams + trigrams
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        return self.vectorizer.transform(texts).toarray().tolist()
@@ -0,0 +1,102 @@
+## Query-embedding cache - bounded in-memory LRU with an optional sqlite tier that survives restarts
+
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+# Leave empty to keep the cache in memory only
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH", "")
+
+
+# Case, whitespace and trailing punctuation don't change what the user is asking
+def normalize_query(text: str) -> str:
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.rstrip("?!. ")
+
+
+class QueryEmbeddingCache:
+    def __init__(self, max_size: int = QUERY_CACHE_SIZE, path: str = QUERY_CACHE_PATH):
+        self.max_size = max_size
+        self.path = path or None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if self.path:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                " model TEXT NOT NULL, query TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL,"
+                " PRIMARY KEY (model, query))"
+            )
+            self._db.commit()
+
+    def _remember(self, key, vector: np.ndarray):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get(self, query: str, model: str):
+        key = (model, normalize_query(query))
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT dim, vector FROM query_embeddings WHERE model = ? AND query = ?", key
+                ).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[1], dtype=np.float32).reshape(row[0])
+                    self._remember(key, vector)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return vector
+            self.misses += 1
+            return None
+
+    def put(self, query: str, model: str, vector) -> np.ndarray:
+        key = (model, normalize_query(query))
+        vector = np.asarray(vector, dtype=np.float32)
+        vector.setflags(write=False)
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (model, query, dim, vector) VALUES (?, ?, ?, ?)",
+                    (*key, vector.shape[0], vector.tobytes()),
+                )
+                self._db.commit()
+        return vector
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM query_embeddings")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "persistent": self._db is not None,
+            }
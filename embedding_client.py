@@ -0,0 +1,104 @@
+## Ollama embedding client - pooled connections, batched requests, bounded concurrency and retries
+
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import requests
+from requests.adapters import HTTPAdapter
+from embedding_backends import Embedder
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "3"))
+EMBED_TIMEOUT = float(os.getenv("EMBED_TIMEOUT", "60"))
+
+# Status codes worth retrying: rate limiting and server-side hiccups (e.g. model still loading)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class EmbeddingError(RuntimeError):
+    pass
+
+
+class OllamaEmbeddingClient(Embedder):
+    backend = "ollama"
+
+    def __init__(self, model: str, base_url: str = OLLAMA_URL, batch_size: int = EMBED_BATCH_SIZE,
+                 workers: int = EMBED_WORKERS, max_retries: int = EMBED_MAX_RETRIES,
+                 timeout: float = EMBED_TIMEOUT, backoff: float = 0.5):
+        super().__init__(model)
+        self.base_url = base_url.rstrip("/")
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.backoff = backoff
+        # None until the first request tells us whether /api/embed (batch) is available
+        self.supports_batch = None
+
+        # One keep-alive pool sized for the worker count, shared by every call
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+        self.requests_sent = 0
+
+    def _post(self, path: str, payload: dict) -> requests.Response:
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+                with self._stats_lock:
+                    self.requests_sent += 1
+                if response.status_code not in RETRY_STATUS:
+                    return response
+                error = f"HTTP {response.status_code}"
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = str(e)
+            if attempt < self.max_retries:
+                delay = self.backoff * (2 ** attempt)
+                logger.warning(f"Embedding request to {path} failed ({error}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+        raise EmbeddingError(f"Embedding request to {self.base_url}{path} failed after {self.max_retries + 1} attempts: {error}")
+
+    def _embed_one(self, text: str) -> List[float]:
+        response = self._post("/api/embeddings", {"model": self.model, "prompt": text})
+        response.raise_for_status()
+        return response.json()["embedding"]
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        if self.supports_batch is not False:
+            response = self._post("/api/embed", {"model": self.model, "input": texts})
+            if response.status_code == 404 and self.supports_batch is None:
+                # Older Ollama servers only have the single-prompt endpoint
+                logger.info("Ollama /api/embed not available, falling back to /api/embeddings")
+                self.supports_batch = False
+            else:
+                response.raise_for_status()
+                self.supports_batch = True
+                embeddings = response.json()["embeddings"]
+                if len(embeddings) != len(texts):
+                    raise EmbeddingError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+                return embeddings
+        return [self._embed_one(text) for text in texts]
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1:
+            results = [self._embed_batch(batches[0])]
+        else:
+            # Probe with the first batch so the batch/single decision is made once, not by every worker
+            results = [self._embed_batch(batches[0])]
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(batches) - 1)) as pool:
+                results.extend(pool.map(self._embed_batch, batches[1:]))
+        return [vec for batch in results for vec in batch]
+
+    def close(self):
+        self.session.close()
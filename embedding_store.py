@@ -0,0 +1,110 @@
+## On-disk embedding store: a memory-mappable .npy matrix plus a JSON sidecar
+##
+## <base>.npy        contiguous float32/float16 matrix, one L2-normalized row per entry
+## <base>.meta.json  header (format, version, backend, model, dim, dtype, count) + keys + descriptions
+
+import hashlib
+import json
+import os
+import pickle
+import numpy as np
+
+STORE_FORMAT = "augur-embeddings"
+STORE_VERSION = 1
+SUPPORTED_DTYPES = ("float32", "float16")
+
+
+def store_paths(base: str):
+    return f"{base}.npy", f"{base}.meta.json"
+
+
+def store_exists(base: str) -> bool:
+    return all(os.path.exists(p) for p in store_paths(base))
+
+
+# Content hash of a description; identical text means the stored vector can be reused
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# Write to a temp file then rename, so readers watching mtimes never see a half-written store
+def _atomic_write(path: str, write):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+class EmbeddingStore:
+    def __init__(self, matrix: np.ndarray, keys: list, descriptions: list, header: dict):
+        self.matrix = matrix
+        self.keys = keys
+        self.descriptions = descriptions
+        self.header = header
+
+    @property
+    def model(self) -> str:
+        return self.header["model"]
+
+    @property
+    def dim(self) -> int:
+        return self.header["dim"]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+def save_store(base: str, embeddings, keys: list, descriptions: list, model: str,
+               dtype: str = "float32", **extra) -> EmbeddingStore:
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported embedding dtype {dtype!r}, expected one of {SUPPORTED_DTYPES}")
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if matrix.ndim != 2 or matrix.shape[0] != len(keys) or len(keys) != len(descriptions):
+        raise ValueError(f"Expected {len(keys)} embeddings, keys and descriptions, got matrix of shape {matrix.shape}")
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix = np.ascontiguousarray(matrix / norms, dtype=dtype)
+
+    header = {
+        "format": STORE_FORMAT,
+        "version": STORE_VERSION,
+        "model": model,
+        "dim": int(matrix.shape[1]),
+        "dtype": dtype,
+        "count": int(matrix.shape[0]),
+        "normalized": True,
+        **extra,
+    }
+    meta = {"header": header, "keys": [list(k) if isinstance(k, tuple) else k for k in keys],
+            "descriptions": list(descriptions)}
+
+    matrix_path, meta_path = store_paths(base)
+    _atomic_write(matrix_path, lambda f: np.save(f, matrix, allow_pickle=False))
+    _atomic_write(meta_path, lambda f: f.write(json.dumps(meta, indent=1).encode("utf-8")))
+    return EmbeddingStore(matrix, keys, list(descriptions), header)
+
+
+# Memory-map the matrix read-only; rows are never copied until they are scored
+def load_store(base: str, mmap: bool = True) -> EmbeddingStore:
+    matrix_path, meta_path = store_paths(base)
+    with open(meta_path, "r") as f:
+        meta = json.load(f)
+    header = meta["header"]
+    if header.get("format") != STORE_FORMAT:
+        raise ValueError(f"{meta_path} is not an {STORE_FORMAT} store")
+    if header.get("version") != STORE_VERSION:
+        raise ValueError(f"{meta_path} has store version {header.get('version')}, expected {STORE_VERSION}; re-run embed")
+
+    matrix = np.load(matrix_path, mmap_mode="r" if mmap else None, allow_pickle=False)
+    if matrix.shape != (header["count"], header["dim"]) or str(matrix.dtype) != header["dtype"]:
+        raise ValueError(f"{matrix_path} does not match its header in {meta_path}")
+
+    keys = [tuple(k) if isinstance(k, list) else k for k in meta["keys"]]
+    return EmbeddingStore(matrix, keys, meta["descriptions"], header)
+
+
+# One-shot converter for the legacy (embeddings, keys, descriptions) pickle
+def convert_pickle(pkl_path: str, base: str, model: str, dtype: str = "float32", **extra) -> EmbeddingStore:
+    with open(pkl_path, "rb") as f:
+        embeddings, keys, descriptions = pickle.load(f)[:3]
+    return save_store(base, embeddings, keys, descriptions, model, dtype=dtype, **extra)
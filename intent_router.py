@@ -0,0 +1,108 @@
+## Fast-path intent router - answers known question shapes with the templated MCP tools, skipping the LLM
+
+import json
+import logging
+import re
+import time
+from dataclasses import dataclass
+from tracing import span, trace_kwargs
+
+logger = logging.getLogger(__name__)
+
+MONTHS = {
+    name: number
+    for number, full in enumerate(
+        ["january", "february", "march", "april", "may", "june", "july",
+         "august", "september", "october", "november", "december"], start=1)
+    for name in (full, full[:3])
+}
+
+# Reusable slot patterns; names are matched as written because repo_name lookups are case-sensitive
+REPO_NAME = r"[`'\"<]?(?P<repo_name>[\w.\-/]+?)[`'\">]?"
+REPO_ID = r"(?:repo(?:sitory)?|project)(?:\s+id)?\s+[`<#]?(?P<repo_id>\d+)[`>]?"
+AUTHOR = r"(?:cmt\s+|commit\s+)?(?:authors?|contributors?|committers?)"
+
+# (tool, pattern) in priority order; every pattern must match the whole question
+ROUTES = [
+    ("get_repo_group_id", rf"(?:what(?:'s| is)\s+)?(?:the\s+)?repo(?:sitory)?\s+group\s+id\s+(?:for|of)\s+{REPO_NAME}"),
+    ("get_repo_id", rf"(?:what(?:'s| is)\s+)?(?:the\s+)?(?:repo(?:sitory)?|project)\s+id\s+(?:for|of)\s+{REPO_NAME}"),
+    ("get_contributor_affiliations", rf"which\s+contributors\s+(?:from|at)\s+(?P<affiliation_keyword>[\w .&-]+?)\s+"
+                                     rf"(?:have\s+)?(?:worked|contributed)\s+(?:on|to)\s+{REPO_NAME}"),
+    ("get_repos_in_group", r"(?:which|what|list(?:\s+the)?)\s+repo(?:sitorie)?s\s+(?:are\s+)?(?:part\s+of|in)\s+"
+                           r"(?:rg|repo\s+group)(?:\s+id)?\s+[`<]?(?P<repo_group_id>\d+)[`>]?"),
+    ("get_repo_last_updated", rf"(?:show\s+(?:me\s+)?)?(?:the\s+)?last\s+update(?:d)?(?:\s+timestamp)?\s+(?:for|of)\s+{REPO_ID}"),
+    ("get_stale_repos", r"(?:which|what|list(?:\s+the)?)\s+repo(?:sitorie)?s\s+(?:have\s*n[o']t|haven['’]?t)\s+been\s+updated\s+"
+                        r"in\s+(?:over\s+|more\s+than\s+)?(?P<days>\d+)\s+days"),
+    ("get_commit_authors", rf"(?:who\s+are\s+|list\s+)?(?:the\s+)?distinct\s+{AUTHOR}\s+(?:to|of|for|in)\s+{REPO_ID}"),
+    ("get_top_author", rf"(?:who\s+is\s+)?(?:the\s+)?top\s+{AUTHOR}\s+(?:to|of|for|in)\s+{REPO_ID}"),
+    ("get_open_issue_count", rf"(?:how\s+many\s+)?open\s+issues\s+(?:are\s+)?(?:there\s+)?(?:in|for)\s+{REPO_ID}"),
+    ("get_issues_opened_in_month", rf"how\s+many\s+issues\s+(?:were\s+)?opened\s+in\s+{REPO_ID}\s+in\s+"
+                                   r"(?P<month>[a-z]+)\s+(?P<year>\d{4})"),
+    ("get_repo_languages", rf"(?:what\s+are\s+)?(?:the\s+)?(?:programming\s+)?languages\s+(?:are\s+)?(?:used\s+)?(?:in|by|for)\s+{REPO_ID}"),
+    ("get_repos_by_language", r"(?:list|show|which)\s+(?:the\s+)?repo(?:sitory|sitorie)?s?(?:\s+names)?\s+(?:that\s+)?"
+                              r"(?:use|uses|using|written\s+in)\s+(?P<language>[\w#+.]+)"),
+]
+COMPILED_ROUTES = [(tool, re.compile(rf"^\s*{pattern}\s*$", re.IGNORECASE)) for tool, pattern in ROUTES]
+
+
+@dataclass
+class Route:
+    tool: str
+    args: dict
+
+
+def _slot_values(slots: dict) -> dict:
+    args = {}
+    for name, value in slots.items():
+        if name == "month":
+            month = MONTHS.get(value.lower())
+            if month is None:
+                return None
+            args[name] = month
+        elif name in ("repo_id", "repo_group_id", "days", "year"):
+            args[name] = int(value)
+        else:
+            args[name] = value
+    return args
+
+
+# Tool and arguments for a question we can answer from a template, or None to fall back to the agent
+def route_question(question: str):
+    text = question.strip().rstrip("?.! ")
+    for tool, pattern in COMPILED_ROUTES:
+        match = pattern.match(text)
+        if match:
+            args = _slot_values(match.groupdict())
+            if args is not None:
+                return Route(tool, args)
+    return None
+
+
+def _content_text(content) -> str:
+    if isinstance(content, str):
+        return content
+    return "".join(getattr(item, "text", "") for item in content or [])
+
+
+# Route and run the question through LlamaStack's tool runtime; None means "use the agent"
+def run_fast_path(client, question: str):
+    route = route_question(question)
+    if route is None:
+        return None
+    start = time.perf_counter()
+    try:
+        with span("fast_path.run", tool=route.tool):
+            # Results go to the user rather than the model, so they are never summarized
+            response = client.tool_runtime.invoke_tool(tool_name=route.tool,
+                                                       kwargs={**route.args, "summarize": False, **trace_kwargs()})
+        text = _content_text(response.content)
+        result = json.loads(text) if text else {}
+    except Exception as e:
+        logger.warning(f"Fast path {route.tool} failed, falling back to agent: {e}")
+        return None
+    latency_ms = 1000 * (time.perf_counter() - start)
+    if response.error_message or (isinstance(result, dict) and "error" in result):
+        logger.warning(f"Fast path {route.tool} returned an error, falling back to agent: "
+                       f"{response.error_message or result.get('error')}")
+        return None
+    return {"route": route.tool, "args": route.args, "result": result, "latency_ms": latency_ms}
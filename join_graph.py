@@ -0,0 +1,109 @@
+## Join graph over augur_schema.json - built from `relationships` and foreign-key `references`,
+## with the shortest join path between every pair of tables precomputed at load
+
+import logging
+import re
+from collections import deque
+from dataclasses import dataclass
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+JOIN_CONDITION = re.compile(r"^\s*(\w+)\.(\w+)\s*=\s*(\w+)\.(\w+)\s*$")
+
+
+@dataclass(frozen=True)
+class Join:
+    left: str
+    left_column: str
+    right: str
+    right_column: str
+
+
+class JoinGraph:
+    def __init__(self, schema: dict):
+        tables = schema["tables"]
+
+        def exists(table, column):
+            return column in tables.get(table, {}).get("columns", {})
+
+        pairs = []
+        for name, relationship in schema.get("relationships", {}).items():
+            match = JOIN_CONDITION.match(relationship.get("join", ""))
+            if match:
+                pairs.append(((match[1], match[2]), (match[3], match[4])))
+            else:
+                logger.warning(f"Relationship {name} has no 'table.column = table.column' join, skipping it")
+        for table, meta in tables.items():
+            for column, col_meta in meta.get("columns", {}).items():
+                reference = col_meta.get("references", "")
+                if "." in reference:
+                    pairs.append(((table, column), tuple(reference.split(".", 1))))
+
+        # Keys equal to the same column are equal to each other, so issues.repo_id = repo_info.repo_id
+        # joins directly instead of bridging through repo
+        parent = {}
+
+        def find(key):
+            parent.setdefault(key, key)
+            while parent[key] != key:
+                parent[key] = parent[parent[key]]
+                key = parent[key]
+            return key
+
+        for a, b in pairs:
+            if not (exists(*a) and exists(*b)):
+                logger.warning(f"Join {'.'.join(a)} = {'.'.join(b)} names a column missing from the schema, skipping it")
+                continue
+            parent[find(a)] = find(b)
+        key_classes = {}
+        for key in parent:
+            key_classes.setdefault(find(key), []).append(key)
+
+        # table -> neighbour table -> Join; the first key pair found between two tables is the one used
+        self.edges = {table: {} for table in tables}
+        for keys in key_classes.values():
+            for i, (left, left_column) in enumerate(keys):
+                for right, right_column in keys[i + 1:]:
+                    if left != right and right not in self.edges[left]:
+                        self.edges[left][right] = Join(left, left_column, right, right_column)
+                        self.edges[right][left] = Join(right, right_column, left, left_column)
+
+        self.paths = {table: self._shortest_paths(table) for table in tables}
+
+    # Breadth-first search; paths[start][end] is the list of joins walking from start to end
+    def _shortest_paths(self, start: str) -> dict:
+        paths = {start: []}
+        queue = deque([start])
+        while queue:
+            table = queue.popleft()
+            for neighbour in sorted(self.edges[table]):
+                if neighbour not in paths:
+                    paths[neighbour] = paths[table] + [self.edges[table][neighbour]]
+                    queue.append(neighbour)
+        return paths
+
+    def path(self, start: str, end: str):
+        return self.paths.get(start, {}).get(end)
+
+    # Joins tying the tables together: each table is attached to the tree built so far by its shortest
+    # path, nearest first. Tables with no path to the rest are left unjoined
+    def connect(self, tables: List[str]) -> List[Join]:
+        tables = [t for t in dict.fromkeys(tables) if t in self.paths]
+        if len(tables) < 2:
+            return []
+        tree = {tables[0]}
+        joins = []
+        remaining = tables[1:]
+        while remaining:
+            options = [(len(path), i, path) for i, table in enumerate(remaining) for member in sorted(tree)
+                       for path in [self.path(member, table)] if path is not None]
+            if not options:
+                break
+            _, i, path = min(options, key=lambda option: option[:2])
+            for join in path:
+                if join.right not in tree:
+                    joins.append(join)
+                    tree.add(join.right)
+            remaining = [t for t in remaining if t not in tree]
+        return joins
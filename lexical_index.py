@@ -0,0 +1,134 @@
+## Lexical schema index - inverted index over the aliases, patterns and common questions in augur_schema.json
+
+import math
+import os
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+from dotenv import load_dotenv
+load_dotenv()
+
+# Share of the question's words that fully matched phrases must explain before vector search is skipped
+LEXICAL_MIN_COVERAGE = float(os.getenv("LEXICAL_MIN_COVERAGE", "0.6"))
+# Reciprocal rank fusion constant; larger values flatten the difference between ranks
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+
+# Lowercased content words with plurals folded, so "repositories" matches the alias "repository"
+def tokenize(text: str) -> list:
+    tokens = []
+    for word in re.findall(r"[a-z]+", text.lower()):
+        if word in ENGLISH_STOP_WORDS or len(word) < 2:
+            continue
+        if word.endswith("ies") and len(word) > 4:
+            word = word[:-3] + "y"
+        elif word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+@dataclass
+class LexicalMatch:
+    # Entities (table names or (table, column) keys) ranked best first, with their scores
+    tables: list
+    columns: list
+    scores: dict
+    # Entities with a phrase matched in full, best first
+    full_matches: list
+    # True when fully matched phrases explain enough of the question to trust the lexical ranking alone
+    confident: bool
+    covered: set = field(default_factory=set)
+
+
+class LexicalIndex:
+    def __init__(self, schema: dict):
+        # phrase id -> (entity, token set); token -> phrase ids
+        self.phrases = []
+        self.postings = defaultdict(list)
+        entity_tokens = defaultdict(set)
+
+        # A column name shared by several tables (repo_id) would match all of them; their aliases tell them apart
+        column_tables = defaultdict(int)
+        for meta in schema["tables"].values():
+            for column in meta.get("columns", {}):
+                column_tables[column] += 1
+
+        for table, meta in schema["tables"].items():
+            phrases = [table.replace("_", " "), *meta.get("aliases", []), *meta.get("common_questions", [])]
+            for patterns in meta.get("query_patterns", {}).values():
+                phrases.extend(patterns)
+            self._add(table, phrases, entity_tokens)
+            for column, col_meta in meta.get("columns", {}).items():
+                phrases = [*col_meta.get("aliases", []), *col_meta.get("patterns", [])]
+                if column_tables[column] == 1:
+                    phrases.append(column.replace("_", " "))
+                self._add((table, column), phrases, entity_tokens)
+
+        # A word that names every entity ("repo") says little; one that names a single column says a lot
+        document_frequency = defaultdict(int)
+        for tokens in entity_tokens.values():
+            for token in tokens:
+                document_frequency[token] += 1
+        self.idf = {token: math.log(1 + len(entity_tokens) / df) for token, df in document_frequency.items()}
+
+    def _add(self, entity, phrases: list, entity_tokens: dict):
+        for phrase in phrases:
+            tokens = frozenset(tokenize(phrase))
+            if not tokens:
+                continue
+            phrase_id = len(self.phrases)
+            self.phrases.append((entity, tokens))
+            entity_tokens[entity].update(tokens)
+            for token in tokens:
+                self.postings[token].append(phrase_id)
+
+    def _weight(self, tokens) -> float:
+        return sum(self.idf.get(token, 0.0) for token in tokens)
+
+    def search(self, query: str) -> LexicalMatch:
+        query_tokens = set(tokenize(query))
+        scores = defaultdict(float)
+        full_matches = defaultdict(set)
+        candidates = {phrase_id for token in query_tokens for phrase_id in self.postings.get(token, ())}
+        for phrase_id in candidates:
+            entity, tokens = self.phrases[phrase_id]
+            matched = tokens & query_tokens
+            coverage = self._weight(matched) / self._weight(tokens)
+            # Partial phrase matches count, but much less than a phrase matched in full
+            scores[entity] = max(scores[entity], self._weight(matched) * coverage ** 2)
+            # Compared as sets: the float coverage can land a hair off 1.0 depending on set iteration order
+            if matched == tokens:
+                full_matches[entity] |= matched
+
+        # A table's score adds its best column's, so a table both named and reached through a column ranks first
+        best_column = defaultdict(float)
+        for entity, score in scores.items():
+            if isinstance(entity, tuple):
+                best_column[entity[0]] = max(best_column[entity[0]], score)
+        table_scores = {t: scores.get(t, 0.0) + best_column[t] for t in {*best_column, *(e for e in scores if isinstance(e, str))}}
+        # Ties are broken by name so the ranking doesn't depend on set iteration order
+        tables = sorted(table_scores, key=lambda t: (-table_scores[t], t))
+        columns = sorted((e for e in scores if isinstance(e, tuple)), key=lambda c: (-scores[c], c))
+
+        covered = set().union(*full_matches.values()) if full_matches else set()
+        full = sorted(full_matches, key=lambda e: (-(table_scores[e] if isinstance(e, str) else table_scores[e[0]] + scores[e]),
+                                                   e if isinstance(e, tuple) else (e, "")))
+        confident = (any(isinstance(e, tuple) for e in full) and
+                     len(covered) / len(query_tokens) >= LEXICAL_MIN_COVERAGE)
+        return LexicalMatch(tables, columns, {**scores, **table_scores}, full, confident, covered)
+
+
+# Fuse best-first rankings: each list adds 1 / (k + rank) for every item it contains
+def reciprocal_rank_fusion(rankings: list, k: int = RRF_K) -> list:
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            fused[item] += 1.0 / (k + rank)
+    # Ties keep the order items were first seen in
+    order = {}
+    for ranking in rankings:
+        for item in ranking:
+            order.setdefault(item, len(order))
+    return sorted(fused, key=lambda item: (-fused[item], order[item]))
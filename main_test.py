@@ -7,7 +7,13 @@ import os
 from dotenv import load_dotenv
 import psycopg2
 import json
-from schema_rag import get_schema_context, get_relevant_tables  # updated RAG imports
+from schema_rag import MODEL_NAME, embed_query, get_schema_index
+from intent_router import run_fast_path
+from semantic_cache import SemanticSQLCache, learn_from_turn, record_chunks, run_cached_sql, tool_calls
+from retrieval_benchmark import fill_placeholders, percentile, readme_queries
+from tracing import record_span, span, trace
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import queue
 import time
 
 logging.basicConfig(
@@ -72,14 +78,23 @@ logger.addHandler(stream_handler)
 parser = argparse.ArgumentParser()
 parser.add_argument("-r", "--remote", help="Use remote LlamaStack server", action="store_true")
 parser.add_argument("-s", "--session-info-on-exit", help="Print agent session info on exit", action="store_true")
-parser.add_argument("-a", "--auto", help="Run preset examples automatically", action="store_true")
+parser.add_argument("-a", "--auto", help="Run the README's supported queries as a batch", action="store_true")
+parser.add_argument("-q", "--questions", help="Run the questions in this file as a batch (one per line, or a "
+                                              "retrieval_questions.json-style file)")
+parser.add_argument("-c", "--concurrency", type=int, default=4, help="Concurrent agent sessions in batch mode")
+parser.add_argument("--repeat", type=int, default=1, help="Ask each batch question this many times")
+parser.add_argument("-o", "--output", default="data/batch_results.jsonl", help="JSONL file for batch results")
+parser.add_argument("--base-url", help="LlamaStack server URL (e.g. a local stand-in); overrides --remote")
+parser.add_argument("--no-fast-path", help="Send every question to the agent, even known question shapes", action="store_true")
 args = parser.parse_args()
 
 model = "llama3.2:3b-instruct-fp16"
 
-base_url = os.getenv("REMOTE_BASE_URL") if args.remote else "http://localhost:8321"
+base_url = args.base_url or (os.getenv("REMOTE_BASE_URL") if args.remote else "http://localhost:8321")
 client = LlamaStackClient(base_url=base_url)
 logger.info(f" Connected to Llama Stack server @ {base_url}")
+schema_index = get_schema_index()
+sql_cache = SemanticSQLCache()
 
 instructions = """
 You are a SQL query expert for the CHAOSS Augur PostgreSQL database.
@@ -150,35 +165,183 @@ agent = Agent(
     sampling_params={"max_tokens": 4096, "strategy": {"type": "greedy", "temperature": 0.0}},
 )
 
-session_id = agent.create_session("ManualSession")
-
-while True:
-    user_input = input(">>> ").strip()
-    time.sleep(2)
-
-    if user_input.lower() in ["/bye", "exit"]:
-        if args.session_info_on_exit:
-            info = client.agents.session.retrieve(session_id=session_id, agent_id=agent.agent_id)
-            print(info.to_dict())
-        break
-
+# Pass the turn stream through, recording each tool execution step (the MCP calls) as a span
+def time_tool_steps(turn):
+    tool_started = None
+    for chunk in turn:
+        payload = getattr(getattr(chunk, "event", None), "payload", None)
+        if getattr(payload, "step_type", None) == "tool_execution":
+            if payload.event_type == "step_start":
+                tool_started = time.perf_counter()
+            elif payload.event_type == "step_complete" and tool_started is not None:
+                record_span("agent.tool", 1000 * (time.perf_counter() - tool_started))
+                tool_started = None
+        yield chunk
+
+# Answer one question: fast path, then semantic cache, then an agent turn. Runs inside a trace, whose id is
+# passed along with every MCP tool call. Returns a record of the route taken and what each stage produced;
+# echo prints the answer and route as it goes (interactive mode)
+def ask(user_input: str, session_id: str, trace_id: str, echo: bool = True) -> dict:
+    record = {"question": user_input, "session_id": session_id, "trace_id": trace_id}
+
+    # Known question shapes go straight to a templated MCP tool
+    fast_path = None if args.no_fast_path else run_fast_path(client, user_input)
+    if fast_path:
+        if echo:
+            logger.info(f">>> [ROUTE] fast_path {fast_path['route']}({fast_path['args']}) in {fast_path['latency_ms']:.0f} ms")
+            print(json.dumps(fast_path["result"], indent=2, default=str))
+        record.update(route="fast_path", tool_calls=[{"tool": fast_path["route"], "arguments": fast_path["args"],
+                                                      "result": fast_path["result"]}])
+        return record
+
+    # A question that names its schema outright is answered without any embedding call, so it also
+    # skips the semantic cache; other paraphrases of questions the agent already answered reuse its SQL
+    lexical = schema_index.lexical_search(user_input)
+    question_embedding = None if lexical.confident else embed_query(user_input)
+    cached_sql = (None if args.no_fast_path or question_embedding is None else
+                  run_cached_sql(client, sql_cache, user_input, question_embedding, MODEL_NAME))
+    if cached_sql:
+        if echo:
+            logger.info(f">>> [ROUTE] semantic_cache matched \"{cached_sql['matched_question']}\" "
+                        f"(similarity {cached_sql['similarity']:.2f}) in {cached_sql['latency_ms']:.0f} ms\n{cached_sql['sql']}")
+            print(json.dumps(cached_sql["result"], indent=2, default=str))
+        record.update(route="semantic_cache", sql=[cached_sql["sql"]],
+                      tool_calls=[{"tool": "execute_query", "arguments": {"sql": cached_sql["sql"]},
+                                   "result": cached_sql["result"]}])
+        return record
+
+    agent_start = time.perf_counter()
     # Get full schema context
-    context_str = get_schema_context(user_input)
+    schema_context = schema_index.build_context(user_input, lexical=lexical)
+    context_str = schema_context.text
     full_prompt = f"""
     You may use the following schema context to answer the user's question.
     {context_str}
-    Use the exactly table.column names from above. Do not mix columns between tables.
+    Use exactly the table and column names from above. Do not mix columns between tables.
     User question: {user_input}
     """
-    debug_tables = get_relevant_tables(user_input)
-    logger.info(f">>> [DEBUG] Relevant tables selected by embeddings: \n" + full_prompt)
-
-    turn = agent.create_turn(
-        session_id=session_id,
-        messages=[{"role": "user", "content": full_prompt}],
-        stream=True,
-    )
-
-    for log in EventLogger().log(turn):
-        log.print()
-
+    if echo:
+        logger.info(f">>> [CONTEXT] {schema_context.tokens} tokens (budget {schema_context.budget or 'none'}), "
+                    f"dropped {schema_context.dropped_tables + schema_context.dropped_columns or 'nothing'}")
+        logger.info(f">>> [DEBUG] Prompt with the schema context selected by retrieval: \n" + full_prompt)
+
+    turn_chunks = []
+    response_parts = []
+    with span("agent.turn"):
+        # Toolgroup args are merged into every MCP tool call of the turn, carrying the trace id to the server
+        turn = agent.create_turn(
+            session_id=session_id,
+            messages=[{"role": "user", "content": full_prompt}],
+            toolgroups=[{"name": "mcp::execute", "args": {"trace_id": trace_id}}],
+            stream=True,
+        )
+        for log in EventLogger().log(time_tool_steps(record_chunks(turn, turn_chunks))):
+            if echo:
+                log.print()
+            elif log.content:
+                response_parts.append(log.content)
+
+    if question_embedding is not None:
+        learn_from_turn(sql_cache, user_input, question_embedding, MODEL_NAME, turn_chunks)
+
+    calls = [{"tool": tool, "arguments": arguments, "result": text} for tool, arguments, text in tool_calls(turn_chunks)]
+    record.update(route="agent", context=context_str, context_tokens=schema_context.tokens,
+                  sql=[c["arguments"]["sql"] for c in calls if c["tool"] == "execute_query" and "sql" in c["arguments"]],
+                  tool_calls=calls, response="".join(response_parts))
+    if echo:
+        logger.info(f">>> [ROUTE] agent in {1000 * (time.perf_counter() - agent_start):.0f} ms")
+    return record
+
+# Ask a question inside its own trace; the record gets the trace's per-stage milliseconds
+def traced_ask(user_input: str, session_id: str, echo: bool = True) -> dict:
+    start = time.perf_counter()
+    with trace("question", question=user_input) as question_trace:
+        try:
+            record = ask(user_input, session_id, question_trace.trace_id, echo)
+        except Exception as e:
+            if echo:
+                raise
+            logger.warning(f"Question failed: {user_input!r}: {e}")
+            record = {"question": user_input, "session_id": session_id, "trace_id": question_trace.trace_id,
+                      "route": "error", "error": repr(e)}
+    record["total_ms"] = round(1000 * (time.perf_counter() - start), 2)
+    record["timings_ms"] = {name: ms for name, ms in question_trace.stage_totals().items() if name != "question"}
+    return record
+
+# Batch questions: a text file with one per line, or a JSON file with {"questions": [{"question": ...}]}
+def load_questions(path: str) -> list:
+    with open(path, "r") as f:
+        if path.endswith(".json"):
+            return [q["question"] for q in json.load(f)["questions"]]
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+def print_summary(records: list, sessions: int, wall_seconds: float):
+    if not records:
+        print("No questions were run, so there is nothing to summarize")
+        return
+    routes = {}
+    for r in records:
+        routes[r["route"]] = routes.get(r["route"], 0) + 1
+    totals = sorted(r["total_ms"] for r in records)
+    print(f"Questions:  {len(records)} over {sessions} sessions, {routes.get('error', 0)} errors")
+    print(f"Routes:     " + ", ".join(f"{route} {count}" for route, count in sorted(routes.items())))
+    print(f"Throughput: {len(records) / wall_seconds:.2f} questions/s ({wall_seconds:.1f} s wall)")
+    print(f"Latency:    p50 {percentile(totals, 50):.0f} ms, p95 {percentile(totals, 95):.0f} ms, "
+          f"p99 {percentile(totals, 99):.0f} ms")
+    stages = {}
+    for r in records:
+        for name, ms in r["timings_ms"].items():
+            stages.setdefault(name, []).append(ms)
+    for name, values in stages.items():
+        values.sort()
+        print(f"  {name:<18} n={len(values):<4} p50 {percentile(values, 50):.0f} ms, p95 {percentile(values, 95):.0f} ms")
+
+# Run questions across `concurrency` agent sessions, appending a JSONL record per question as it finishes
+def run_batch(questions: list, concurrency: int, output: str):
+    if not questions:
+        print("No questions to run")
+        return
+    sessions = queue.Queue()
+    for i in range(concurrency):
+        sessions.put(agent.create_session(f"BatchSession-{i}"))
+    records = []
+
+    def worker(question: str) -> dict:
+        session_id = sessions.get()
+        try:
+            return traced_ask(question, session_id, echo=False)
+        finally:
+            sessions.put(session_id)
+
+    start = time.perf_counter()
+    with open(output, "w") as f, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(worker, question) for question in questions]
+        for future in as_completed(futures):
+            record = future.result()
+            f.write(json.dumps(record, default=str) + "\n")
+            f.flush()
+            records.append(record)
+            print(f"[{len(records)}/{len(questions)}] {record['route']:<14} {record['total_ms']:>7.0f} ms  {record['question']}")
+    wall_seconds = time.perf_counter() - start
+    print(f"\nWrote {len(records)} records to {output}")
+    print_summary(records, concurrency, wall_seconds)
+
+if args.auto or args.questions:
+    questions = load_questions(args.questions) if args.questions else [fill_placeholders(q) for q in readme_queries()]
+    run_batch(questions * args.repeat, max(1, args.concurrency), args.output)
+else:
+    session_id = agent.create_session("ManualSession")
+    while True:
+        user_input = input(">>> ").strip()
+
+        if user_input.lower() in ["/bye", "exit"]:
+            if args.session_info_on_exit:
+                info = client.agents.session.retrieve(session_id=session_id, agent_id=agent.agent_id)
+                print(info.to_dict())
+            break
+        if not user_input:
+            continue
+
+        record = traced_ask(user_input, session_id)
+        logger.info(f">>> [TRACE] {record['trace_id']}: " +
+                    ", ".join(f"{name} {ms:.0f} ms" for name, ms in record["timings_ms"].items()))
@@ -1,64 +1,460 @@
 ## Custom MCP server - connects to a postgres database and executes SQL
 
 from mcp.server.fastmcp import FastMCP
-import psycopg2
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Mount
+from db_pool import get_pool, pool_stats
+from metrics import CACHE_LOOKUPS, CONTENT_TYPE, SQL_ROWS, SQL_SECONDS, TOOL_CALLS, render
+from result_cache import ResultCache, sql_key, tool_key
+from result_encoding import RESULT_FORMATS, SQL_RESULT_FORMAT, json_default, shape_result
+from tracing import span
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import functools
+import json
+import logging
 import os
+import re
+import psycopg2
+import psycopg2.errors
+import uvicorn
 from dotenv import load_dotenv
 load_dotenv()
 
 mcp = FastMCP("execute")
+# The templated tools are a separate server, so the agent's toolgroup only carries the tools it is told to use
+templates = FastMCP("templates")
+logger = logging.getLogger(__name__)
+
+# Result limits - keep huge result sets out of server memory and the model's context
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", "500"))
+SQL_MAX_BYTES = int(os.getenv("SQL_MAX_BYTES", "65536"))
+SQL_FETCH_SIZE = int(os.getenv("SQL_FETCH_SIZE", "100"))
 
-# Core SQL executor
-def execute_sql(sql: str) -> list[dict]:
+# Statements that can be wrapped in DECLARE ... CURSOR and streamed from the server
+CURSOR_STATEMENT = re.compile(r"^\s*(\(\s*)*(select|with|values|table)\b", re.IGNORECASE)
+
+# Pre-flight cost gate: "off", "warn" (log and run anyway) or "reject"
+SQL_PREFLIGHT = os.getenv("SQL_PREFLIGHT", "warn").lower()
+SQL_MAX_PLAN_COST = float(os.getenv("SQL_MAX_PLAN_COST", "1000000"))
+SQL_MAX_PLAN_ROWS = float(os.getenv("SQL_MAX_PLAN_ROWS", "1000000"))
+SQL_STATEMENT_TIMEOUT_MS = int(os.getenv("SQL_STATEMENT_TIMEOUT_MS", "30000"))
+
+# Top node of the planner's EXPLAIN output, or None if the statement can't be explained
+def explain_plan(conn, sql: str, params=None):
     try:
-        conn = psycopg2.connect(
-            dbname=os.getenv("AUGUR_DB", "augur"),
-            user=os.getenv("AUGUR_USER", "your_db_user"),
-            password=os.getenv("AUGUR_PASSWORD", "your_db_password"),
-            host=os.getenv("AUGUR_HOST", "localhost"),
-            port=os.getenv("AUGUR_PORT", "5432"),
-)
-        cursor = conn.cursor()
-        cursor.execute("SET search_path TO augur_data;")
-        cursor.execute(sql)
-        colnames = [desc[0] for desc in cursor.description]
-        rows = cursor.fetchall()
-        return [dict(zip(colnames, row)) for row in rows]
+        with conn.cursor() as cursor:
+            cursor.execute("SAVEPOINT explain_plan")
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0][0]["Plan"]
+            cursor.execute("RELEASE SAVEPOINT explain_plan")
+            return plan
+    except psycopg2.errors.QueryCanceled:
+        raise
+    except psycopg2.Error:
+        with conn.cursor() as cursor:
+            cursor.execute("ROLLBACK TO SAVEPOINT explain_plan")
+        return None
+
+# Compare the plan against the configured limits; returns a list of human-readable violations
+def plan_violations(plan: dict) -> list[str]:
+    violations = []
+    if plan["Total Cost"] > SQL_MAX_PLAN_COST:
+        violations.append(f"estimated cost {plan['Total Cost']:.0f} exceeds {SQL_MAX_PLAN_COST:.0f}")
+    if plan["Plan Rows"] > SQL_MAX_PLAN_ROWS:
+        violations.append(f"estimated rows {plan['Plan Rows']:.0f} exceeds {SQL_MAX_PLAN_ROWS:.0f}")
+    return violations
+
+# Core SQL executor - borrows a pooled connection already set to augur_data and read-only,
+# gates expensive plans, streams rows with fetchmany and stops at SQL_MAX_ROWS rows or SQL_MAX_BYTES of JSON
+def execute_sql(sql: str, params=None, max_rows: int = SQL_MAX_ROWS, max_bytes: int = SQL_MAX_BYTES) -> dict:
+    with span("sql") as record:
+        result = _execute_sql(sql, params, max_rows, max_bytes)
+        record.update(rows=result.get("row_count", 0), truncated=result.get("truncated", False),
+                      outcome="error" if "error" in result else "ok", sql_error=result.get("error"))
+    SQL_SECONDS.observe(record["duration_ms"] / 1000, outcome=record["outcome"])
+    if "error" not in result:
+        SQL_ROWS.observe(result["row_count"])
+    return result
+
+def _execute_sql(sql: str, params=None, max_rows: int = SQL_MAX_ROWS, max_bytes: int = SQL_MAX_BYTES) -> dict:
+    try:
+        with get_pool().connection() as conn:
+            with conn.cursor() as cursor:
+                # SET LOCAL only lasts for this transaction; the pool rolls back on release
+                cursor.execute("SET LOCAL statement_timeout = %s", (SQL_STATEMENT_TIMEOUT_MS,))
+
+            # Named cursors keep the result set on the server; other statements (SHOW, EXPLAIN) can't use them
+            cursor_name = "augur_query" if CURSOR_STATEMENT.match(sql) else None
+            with span("sql.preflight"):
+                plan = explain_plan(conn, sql, params) if cursor_name and SQL_PREFLIGHT != "off" else None
+            warnings = plan_violations(plan) if plan else []
+            if warnings:
+                logger.warning(f"Expensive plan ({'; '.join(warnings)}) for SQL: {sql}")
+                if SQL_PREFLIGHT == "reject":
+                    return {
+                        "error": "query_too_expensive",
+                        "message": "Query rejected before execution: " + "; ".join(warnings),
+                        "estimated_cost": plan["Total Cost"],
+                        "estimated_rows": plan["Plan Rows"],
+                        "limits": {"max_cost": SQL_MAX_PLAN_COST, "max_rows": SQL_MAX_PLAN_ROWS},
+                        "hint": "Filter on an indexed key such as repo_id, aggregate, or add a LIMIT, then retry.",
+                    }
+
+            rows = []
+            used_bytes = 0
+            truncated_by = None
+            with span("sql.fetch"), conn.cursor(name=cursor_name) as cursor:
+                cursor.execute(sql, params)
+                colnames = None
+                while truncated_by is None:
+                    batch = cursor.fetchmany(min(SQL_FETCH_SIZE, max_rows - len(rows) + 1))
+                    if colnames is None:
+                        colnames = [desc[0] for desc in cursor.description]
+                    if not batch:
+                        break
+                    for row in batch:
+                        if len(rows) >= max_rows:
+                            truncated_by = "max_rows"
+                            break
+                        record = dict(zip(colnames, row))
+                        used_bytes += len(json.dumps(record, default=json_default))
+                        if used_bytes > max_bytes:
+                            truncated_by = "max_bytes"
+                            break
+                        rows.append(record)
+
+            total_rows = len(rows)
+            if truncated_by:
+                # Planner's row estimate tells the agent roughly how much was left out
+                if plan is None and cursor_name:
+                    plan = explain_plan(conn, sql, params)
+                total_rows = max(int(plan["Plan Rows"]) if plan else 0, len(rows) + 1)
+            result = {
+                "columns": colnames,
+                "rows": rows,
+                "row_count": len(rows),
+                "truncated": truncated_by is not None,
+                "truncated_by": truncated_by,
+                "total_rows_estimate": total_rows,
+            }
+            if warnings:
+                result["warnings"] = warnings
+            return result
+    except psycopg2.errors.QueryCanceled:
+        logger.warning(f"Statement timeout after {SQL_STATEMENT_TIMEOUT_MS} ms for SQL: {sql}")
+        return {
+            "error": "statement_timeout",
+            "message": f"Query cancelled after {SQL_STATEMENT_TIMEOUT_MS} ms",
+            "hint": "Filter on an indexed key such as repo_id, aggregate, or add a LIMIT, then retry.",
+        }
+    except psycopg2.Error as e:
+        # The SQLSTATE tells callers a broken statement (class 42) from a connection or load problem
+        return {"error": str(e), "sqlstate": e.pgcode}
     except Exception as e:
-        return [{"error": str(e)}]
-    finally:
-        if 'cursor' in locals(): cursor.close()
-        if 'conn' in locals(): conn.close()
+        return {"error": str(e)}
+
+# Tool concurrency - queries beyond SQL_MAX_CONCURRENCY wait, and beyond SQL_MAX_QUEUE waiting are turned away
+SQL_MAX_CONCURRENCY = int(os.getenv("SQL_MAX_CONCURRENCY", "8"))
+SQL_MAX_QUEUE = int(os.getenv("SQL_MAX_QUEUE", "16"))
+
+# Runs blocking psycopg2 work on a bounded thread pool so the SSE event loop keeps serving other sessions
+class SQLLimiter:
+    def __init__(self, max_concurrency: int = SQL_MAX_CONCURRENCY, max_queue: int = SQL_MAX_QUEUE):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="sql")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.running = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    async def run(self, func, *args) -> dict:
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            return {
+                "error": "busy",
+                "message": f"SQL server is busy ({self.running} running, {self.waiting} queued); retry shortly.",
+            }
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            # Run in a copy of the caller's context so spans opened in the worker thread join the tool's trace
+            call = functools.partial(contextvars.copy_context().run, func, *args)
+            return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
+
+sql_limiter = SQLLimiter()
+
+# Shared TTL cache for tool results (SQL_CACHE_TTL / SQL_CACHE_SIZE)
+result_cache = ResultCache()
+
+# Serve from the result cache unless fresh=True; every response says whether it was cached.
+# Cache hits never touch the limiter, so they stay fast even when the database is saturated.
+# trace_id is the caller's correlation id (see tracing.py); the call is recorded as a span of that trace.
+# Rows are cached as fetched and encoded per call: result_format "rows" or "columns" (empty for the
+# SQL_RESULT_FORMAT default), and summarized past SQL_RESULT_TOKEN_BUDGET unless summarize is False
+async def cached_result(key: tuple, sql: str, params=None, fresh: bool = False, trace_id: str = "",
+                        result_format: str = "", summarize: bool = True) -> dict:
+    tool_name = key[1] if key[0] == "tool" else "execute_query"
+    result_format = (result_format or SQL_RESULT_FORMAT).lower()
+    if result_format not in RESULT_FORMATS:
+        TOOL_CALLS.inc(tool=tool_name, outcome="error")
+        return {"error": f"Unknown result_format {result_format!r}, expected one of {', '.join(RESULT_FORMATS)}"}
+    with span(f"mcp.{tool_name}", trace_id=trace_id or None, fresh=fresh) as record:
+        result = shape_result(await _cached_result(key, sql, params, fresh), result_format, summarize)
+        record.update(cached=result.get("cached"), format=result.get("format"),
+                      outcome="error" if "error" in result else "ok")
+    TOOL_CALLS.inc(tool=tool_name, outcome=record["outcome"])
+    return result
+
+async def _cached_result(key: tuple, sql: str, params, fresh: bool) -> dict:
+    if not fresh:
+        cached = result_cache.get(key)
+        CACHE_LOOKUPS.inc(cache="sql_result", result="miss" if cached is None else "hit")
+        if cached is not None:
+            return cached
+    result = await sql_limiter.run(execute_sql, sql, params)
+    result_cache.put(key, result)
+    return {**result, "cached": False}
 
 ## MCP tool - works with core SQL executor
 @mcp.tool()
-def execute_query(sql: str) -> list[dict]:
+async def execute_query(sql: str, fresh: bool = False, trace_id: str = "", result_format: str = "",
+                        summarize: bool = True) -> dict:
     """
     Executes a raw SQL query against the augur_data schema.
     Use this for all analytics queries about a project.
+    Returns {"columns": [...], "types": [...], "values": [[...] per column], "truncated": bool,
+    "total_rows_estimate": int}; pass result_format="rows" for a list of row objects instead.
+    If truncated is true, refine the query (filter, aggregate or add LIMIT) instead of asking for every row.
+    Large results come back as "format": "summary" with per-column count, min/max and top values plus a
+    few sample rows; aggregate in SQL for exact figures, or pass summarize=false to get the rows.
+    Results may be served from a short-lived cache ("cached": true); pass fresh=true to bypass it.
     """
-    return execute_sql(sql)
+    return await cached_result(sql_key(sql), sql, fresh=fresh, trace_id=trace_id,
+                               result_format=result_format, summarize=summarize)
 
 
 @mcp.tool()
-def get_contributor_affiliations(repo_name: str, affiliation_keyword: str) -> list[dict]:
+async def get_contributor_affiliations(repo_name: str, affiliation_keyword: str, fresh: bool = False, trace_id: str = "",
+                                       result_format: str = "", summarize: bool = True) -> dict:
     """
     Retrieve affiliation details for contributors on a given repository, optionally filtered by company name or email domain.
     """
-    sql = f"""
+    sql = """
         SELECT DISTINCT c.cntrb_full_name, ca.ca_affiliation
         FROM augur_data.commits cm
         JOIN augur_data.repo r ON cm.repo_id = r.repo_id
         JOIN augur_data.contributors c ON cm.cmt_ght_author_id = c.cntrb_id
         JOIN augur_data.contributor_affiliations ca ON c.cntrb_company = ca.ca_affiliation
-        WHERE r.repo_name = '{repo_name}' AND ca.ca_affiliation ILIKE '%{affiliation_keyword}%'
+        WHERE r.repo_name = %s AND ca.ca_affiliation ILIKE '%%' || %s || '%%'
         LIMIT 50
     """
-    return execute_sql(sql)
+    return await run_template("get_contributor_affiliations", sql, fresh, trace_id, result_format, summarize,
+                              repo_name=repo_name, affiliation_keyword=affiliation_keyword)
+
+
+## Templated tools - parameterized SQL for the common questions in the README.
+## The UI's fast-path router (intent_router.py) calls these directly without an LLM turn. They are served at
+## /templates/sse and registered as their own toolgroup, which the agent is never given.
+
+# Bind arguments in order and cache on tool name + arguments
+async def run_template(tool_name: str, sql: str, fresh: bool = False, trace_id: str = "", result_format: str = "",
+                       summarize: bool = True, **arguments) -> dict:
+    return await cached_result(tool_key(tool_name, **arguments), sql, tuple(arguments.values()), fresh, trace_id,
+                               result_format, summarize)
+
+
+@templates.tool()
+async def get_repo_id(repo_name: str, fresh: bool = False, trace_id: str = "",
+                      result_format: str = "", summarize: bool = True) -> dict:
+    """
+    Look up the repo_id for a repository by its exact name.
+    """
+    sql = "SELECT repo_id, repo_name, repo_git FROM augur_data.repo WHERE repo_name = %s"
+    return await run_template("get_repo_id", sql, fresh, trace_id, result_format, summarize, repo_name=repo_name)
+
+
+@templates.tool()
+async def get_repo_group_id(repo_name: str, fresh: bool = False, trace_id: str = "",
+                            result_format: str = "", summarize: bool = True) -> dict:
+    """
+    Look up the repo_group_id a repository belongs to, by repository name.
+    """
+    sql = "SELECT repo_id, repo_name, repo_group_id FROM augur_data.repo WHERE repo_name = %s"
+    return await run_template("get_repo_group_id", sql, fresh, trace_id, result_format, summarize, repo_name=repo_name)
+
+
+@templates.tool()
+async def get_repos_in_group(repo_group_id: int, fresh: bool = False, trace_id: str = "",
+                             result_format: str = "", summarize: bool = True) -> dict:
+    """
+    List the repositories that are part of a repo group.
+    """
+    sql = """
+        SELECT repo_id, repo_name FROM augur_data.repo
+        WHERE repo_group_id = %s ORDER BY repo_name
+    """
+    return await run_template("get_repos_in_group", sql, fresh, trace_id, result_format, summarize, repo_group_id=repo_group_id)
+
+
+@templates.tool()
+async def get_repo_last_updated(repo_id: int, fresh: bool = False, trace_id: str = "",
+                                result_format: str = "", summarize: bool = True) -> dict:
+    """
+    Show the most recent update timestamp Augur recorded for a repository.
+    """
+    sql = "SELECT repo_id, MAX(last_updated) AS last_updated FROM augur_data.repo_info WHERE repo_id = %s GROUP BY repo_id"
+    return await run_template("get_repo_last_updated", sql, fresh, trace_id, result_format, summarize, repo_id=repo_id)
+
+
+@templates.tool()
+async def get_stale_repos(days: int = 90, fresh: bool = False, trace_id: str = "",
+                          result_format: str = "", summarize: bool = True) -> dict:
+    """
+    List repositories that have not been updated in more than the given number of days.
+    """
+    sql = """
+        SELECT r.repo_id, r.repo_name, MAX(ri.last_updated) AS last_updated
+        FROM augur_data.repo r
+        JOIN augur_data.repo_info ri ON ri.repo_id = r.repo_id
+        GROUP BY r.repo_id, r.repo_name
+        HAVING MAX(ri.last_updated) < NOW() - make_interval(days => %s)
+        ORDER BY last_updated
+    """
+    return await run_template("get_stale_repos", sql, fresh, trace_id, result_format, summarize, days=days)
+
+
+@templates.tool()
+async def get_commit_authors(repo_id: int, fresh: bool = False, trace_id: str = "",
+                             result_format: str = "", summarize: bool = True) -> dict:
+    """
+    List the distinct commit authors (by email) for a repository.
+    """
+    sql = """
+        SELECT DISTINCT cmt_author_email FROM augur_data.commits
+        WHERE repo_id = %s ORDER BY cmt_author_email
+    """
+    return await run_template("get_commit_authors", sql, fresh, trace_id, result_format, summarize, repo_id=repo_id)
+
+
+@templates.tool()
+async def get_top_author(repo_id: int, limit: int = 1, fresh: bool = False, trace_id: str = "",
+                         result_format: str = "", summarize: bool = True) -> dict:
+    """
+    Rank commit authors for a repository by number of commits.
+    """
+    sql = """
+        SELECT cmt_author_email, COUNT(*) AS commits FROM augur_data.commits
+        WHERE repo_id = %s GROUP BY cmt_author_email ORDER BY commits DESC LIMIT %s
+    """
+    return await run_template("get_top_author", sql, fresh, trace_id, result_format, summarize, repo_id=repo_id, limit=limit)
+
+
+@templates.tool()
+async def get_open_issue_count(repo_id: int, fresh: bool = False, trace_id: str = "",
+                               result_format: str = "", summarize: bool = True) -> dict:
+    """
+    Count the issues in a repository that are still open (not closed).
+    """
+    sql = "SELECT COUNT(*) AS open_issues FROM augur_data.issues WHERE repo_id = %s AND closed_at IS NULL"
+    return await run_template("get_open_issue_count", sql, fresh, trace_id, result_format, summarize, repo_id=repo_id)
+
+
+@templates.tool()
+async def get_issues_opened_in_month(repo_id: int, year: int, month: int, fresh: bool = False, trace_id: str = "",
+                                     result_format: str = "", summarize: bool = True) -> dict:
+    """
+    Count the issues opened in a repository during a given calendar month.
+    """
+    sql = """
+        SELECT COUNT(*) AS issues_opened FROM augur_data.issues
+        WHERE repo_id = %s
+          AND created_at >= make_date(%s, %s, 1)
+          AND created_at < make_date(%s, %s, 1) + INTERVAL '1 month'
+    """
+    params = (repo_id, year, month, year, month)
+    key = tool_key("get_issues_opened_in_month", repo_id=repo_id, year=year, month=month)
+    return await cached_result(key, sql, params, fresh, trace_id, result_format, summarize)
+
+
+@templates.tool()
+async def get_repo_languages(repo_id: int, fresh: bool = False, trace_id: str = "",
+                             result_format: str = "", summarize: bool = True) -> dict:
+    """
+    List the programming languages used in a repository.
+    """
+    sql = """
+        SELECT DISTINCT programming_language FROM augur_data.explorer_repo_languages
+        WHERE repo_id = %s ORDER BY programming_language
+    """
+    return await run_template("get_repo_languages", sql, fresh, trace_id, result_format, summarize, repo_id=repo_id)
+
+
+@templates.tool()
+async def get_repos_by_language(language: str, fresh: bool = False, trace_id: str = "",
+                                result_format: str = "", summarize: bool = True) -> dict:
+    """
+    List the names of repositories that use a programming language.
+    """
+    sql = """
+        SELECT DISTINCT repo_name FROM augur_data.explorer_repo_languages
+        WHERE programming_language ILIKE %s ORDER BY repo_name
+    """
+    return await run_template("get_repos_by_language", sql, fresh, trace_id, result_format, summarize, language=language)
+
+
+## Monitoring - connection pool usage and wait times
+@mcp.custom_route("/stats/pool", methods=["GET"])
+async def pool_stats_route(request: Request) -> JSONResponse:
+    return JSONResponse(pool_stats())
+
+
+@mcp.custom_route("/stats/queue", methods=["GET"])
+async def queue_stats_route(request: Request) -> JSONResponse:
+    return JSONResponse(sql_limiter.stats())
+
+
+## Result cache - hit/miss counters, and a way to drop everything after an Augur collection run
+@mcp.custom_route("/stats/cache", methods=["GET"])
+async def cache_stats_route(request: Request) -> JSONResponse:
+    return JSONResponse(result_cache.stats())
+
+
+## Prometheus scrape endpoint - tool calls, cache lookups, SQL latency and rows, span durations
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics_route(request: Request) -> PlainTextResponse:
+    return PlainTextResponse(render(), media_type=CONTENT_TYPE)
+
+
+@mcp.custom_route("/cache/invalidate", methods=["POST"])
+async def cache_invalidate_route(request: Request) -> JSONResponse:
+    return JSONResponse({"invalidated": result_cache.invalidate()})
 
 
 # Start the MCP server
-if __name__ == "__main__":
-    mcp.run(transport="sse")
+# Both servers in one process, sharing the connection pool, limiter and result cache
+app = Starlette(routes=[Mount("/templates", app=templates.sse_app()), Mount("/", app=mcp.sse_app())])
 
-app = mcp.sse_app
+if __name__ == "__main__":
+    # Same host and port mcp.run would use, but serving both servers
+    uvicorn.run(app, host=mcp.settings.host, port=mcp.settings.port)
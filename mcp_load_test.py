@@ -0,0 +1,58 @@
+## Load test for the MCP SQL server - one slow query runs while several sessions issue quick lookups
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+from dotenv import load_dotenv
+load_dotenv()
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--url", default=os.getenv("EXECUTE_MCP_URI", "http://localhost:9002/sse"), help="MCP server SSE endpoint")
+parser.add_argument("--sessions", type=int, default=5, help="Concurrent sessions issuing fast queries")
+parser.add_argument("--requests", type=int, default=10, help="Fast queries per session")
+parser.add_argument("--slow-seconds", type=float, default=5.0, help="Duration of the slow query (pg_sleep)")
+parser.add_argument("--fast-sql", default="SELECT repo_id FROM augur_data.repo LIMIT 1", help="Query each fast session runs")
+args = parser.parse_args()
+
+
+async def run_session(calls: list, record: list):
+    async with sse_client(args.url) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            for tool, arguments in calls:
+                start = time.perf_counter()
+                result = await session.call_tool(tool, arguments)
+                # SQL failures (including "busy") come back as an {"error": ...} payload, not a protocol error
+                text = "".join(getattr(block, "text", "") for block in result.content)
+                record.append((time.perf_counter() - start, result.isError or '"error"' in text))
+
+
+async def main():
+    slow, fast = [], []
+    slow_task = asyncio.create_task(run_session(
+        [("execute_query", {"sql": f"SELECT pg_sleep({args.slow_seconds})", "fresh": True})], slow))
+    # Give the slow query a head start so the fast sessions run while it holds a connection
+    await asyncio.sleep(0.5)
+    fast_calls = [("execute_query", {"sql": args.fast_sql, "fresh": True})] * args.requests
+    await asyncio.gather(*(run_session(fast_calls, fast) for _ in range(args.sessions)))
+    await slow_task
+
+    latencies = sorted(seconds * 1000 for seconds, _ in fast)
+    errors = sum(1 for _, is_error in fast if is_error)
+    print(f"Slow query:   {slow[0][0]:.2f}s")
+    print(f"Fast queries: {len(latencies)} across {args.sessions} sessions, {errors} errors")
+    print(f"  p50 {statistics.median(latencies):.1f} ms, "
+          f"p95 {latencies[int(0.95 * (len(latencies) - 1))]:.1f} ms, max {latencies[-1]:.1f} ms")
+    # A fast call that took about as long as the slow query's remaining time was stuck behind it
+    if latencies[-1] / 1000 < args.slow_seconds - 0.5:
+        print("Fast sessions were not blocked by the slow query.")
+    else:
+        print("Fast sessions waited on the slow query.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,124 @@
+## Prometheus-style metrics - counters and histograms kept in-process and rendered in the text exposition format
+
+import bisect
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+load_dotenv()
+
+# Port for a standalone /metrics endpoint in processes that aren't the MCP app (UI, CLI); empty to disable
+METRICS_PORT = os.getenv("METRICS_PORT", "")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ROW_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 5000)
+
+
+def _label_text(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = ['%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"')) for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+        REGISTRY.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # label values -> [per-bucket counts (last is +Inf), sum, count]
+        self._values = {}
+        REGISTRY.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0, 0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip([*self.buckets, "+Inf"], counts):
+                    cumulative += bucket_count
+                    labels = _label_text(self.labels, key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_label_text(self.labels, key)} {count}")
+        return lines
+
+
+REGISTRY = []
+
+# Shared metric definitions; each process only fills in the ones it exercises
+EMBEDDING_CALLS = Counter("augur_embedding_calls_total", "Embedding requests by backend", ("backend",))
+EMBEDDING_TEXTS = Counter("augur_embedding_texts_total", "Texts embedded by backend", ("backend",))
+EMBEDDING_SECONDS = Histogram("augur_embedding_seconds", "Embedding call latency", ("backend",))
+CACHE_LOOKUPS = Counter("augur_cache_lookups_total", "Cache lookups by cache and result (hit/miss)", ("cache", "result"))
+STAGE_SECONDS = Histogram("augur_stage_seconds", "Duration of traced stages (spans) by name", ("stage",))
+TOOL_CALLS = Counter("augur_tool_calls_total", "MCP tool calls by tool and outcome", ("tool", "outcome"))
+SQL_SECONDS = Histogram("augur_sql_seconds", "Time spent in Postgres per statement, by outcome", ("outcome",))
+SQL_ROWS = Histogram("augur_sql_rows", "Rows returned per statement", buckets=ROW_BUCKETS)
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_server = None
+_server_lock = threading.Lock()
+
+
+# Serve /metrics from a daemon thread; safe to call more than once (e.g. on Streamlit reruns)
+def serve_metrics(port: int):
+    global _server
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
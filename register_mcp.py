@@ -9,8 +9,11 @@ load_dotenv()
 base_url = os.getenv("BASE_URL", "http://localhost:8321")
 client = LlamaStackClient(base_url = base_url)
 
+# mcp::execute is the agent's toolgroup; mcp::templates holds the fast-path router's templated tools, which the
+# router invokes by name and the agent is never given
 custom_tools = {
-    "mcp::execute": os.getenv("EXECUTE_MCP_URI")
+    "mcp::execute": os.getenv("EXECUTE_MCP_URI"),
+    "mcp::templates": os.getenv("TEMPLATES_MCP_URI"),
 }
 
 
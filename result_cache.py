@@ -0,0 +1,95 @@
+## TTL + LRU cache for SQL tool results - Augur data only refreshes periodically
+
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+load_dotenv()
+
+SQL_CACHE_TTL = float(os.getenv("SQL_CACHE_TTL", "300"))
+SQL_CACHE_SIZE = int(os.getenv("SQL_CACHE_SIZE", "256"))
+
+# Quoted literals and identifiers are kept verbatim; everything else is case/whitespace-insensitive
+SQL_QUOTED = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+
+
+def normalize_sql(sql: str) -> str:
+    parts = SQL_QUOTED.split(sql.strip().rstrip(";").strip())
+    return "".join(
+        part if i % 2 else re.sub(r"\s+", " ", part.lower())
+        for i, part in enumerate(parts)
+    ).strip()
+
+
+def sql_key(sql: str) -> tuple:
+    return ("sql", normalize_sql(sql))
+
+
+def tool_key(tool_name: str, **arguments) -> tuple:
+    return ("tool", tool_name, json.dumps(arguments, sort_keys=True, default=str))
+
+
+class ResultCache:
+    def __init__(self, ttl: float = SQL_CACHE_TTL, max_size: int = SQL_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_size > 0
+
+    def get(self, key: tuple):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        stored_at, cached_at, result = entry
+        return {**result, "cached": True, "cached_at": cached_at,
+                "cache_age_seconds": round(time.monotonic() - stored_at, 1)}
+
+    def put(self, key: tuple, result: dict):
+        # Errors are never cached so a retry can succeed
+        if not self.enabled or "error" in result:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), datetime.now(timezone.utc).isoformat(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: tuple = None) -> int:
+        with self._lock:
+            if key is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+            return 1 if self._entries.pop(key, None) is not None else 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+            }
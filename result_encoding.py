@@ -0,0 +1,176 @@
+## Tool result encoding - JSON-safe values, a columnar payload, and per-column summaries for large results
+
+import base64
+import datetime
+import decimal
+import json
+import math
+import os
+import uuid
+from collections import Counter
+from token_estimate import estimate_tokens
+from dotenv import load_dotenv
+load_dotenv()
+
+# "rows" (a dict per row) or "columns" (column names once, one value array per column)
+SQL_RESULT_FORMAT = os.getenv("SQL_RESULT_FORMAT", "columns").lower()
+# Results estimated above this many tokens are replaced by per-column statistics (0 disables)
+SQL_RESULT_TOKEN_BUDGET = int(os.getenv("SQL_RESULT_TOKEN_BUDGET", "2000"))
+# Most common values listed per column, and leading rows kept as a sample, in a summary
+SQL_SUMMARY_TOP_N = int(os.getenv("SQL_SUMMARY_TOP_N", "5"))
+SQL_SUMMARY_SAMPLE_ROWS = int(os.getenv("SQL_SUMMARY_SAMPLE_ROWS", "5"))
+
+RESULT_FORMATS = ("rows", "columns")
+
+
+# psycopg2 values as JSON-native ones: numerics stay numbers, timestamps become ISO strings
+def encode_value(value):
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    if isinstance(value, float):
+        # NaN and infinity aren't valid JSON
+        return value if math.isfinite(value) else None
+    if isinstance(value, decimal.Decimal):
+        if not value.is_finite():
+            return None
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(value)).decode("ascii")
+    if isinstance(value, dict):
+        return {str(k): encode_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [encode_value(v) for v in value]
+    return str(value)
+
+
+# json.dumps default= hook for the same conversions
+def json_default(value):
+    return encode_value(value)
+
+
+def value_type(value) -> str:
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "integer"
+    if isinstance(value, decimal.Decimal):
+        return "integer" if value.is_finite() and value == value.to_integral_value() else "number"
+    if isinstance(value, float):
+        return "number"
+    if isinstance(value, datetime.datetime):
+        return "timestamp"
+    if isinstance(value, datetime.date):
+        return "date"
+    if isinstance(value, datetime.time):
+        return "time"
+    if isinstance(value, datetime.timedelta):
+        return "interval_seconds"
+    if isinstance(value, (dict, list, tuple)):
+        return "json"
+    return "text"
+
+
+# One type per column from its non-null values; integer and number columns mixed together are "number"
+def column_type(values: list) -> str:
+    types = {value_type(v) for v in values if v is not None}
+    if not types:
+        return "null"
+    if types <= {"integer", "number"}:
+        return "number" if "number" in types else "integer"
+    return types.pop() if len(types) == 1 else "text"
+
+
+def _columns(result: dict) -> list:
+    if result.get("columns"):
+        return result["columns"]
+    return list(result["rows"][0]) if result.get("rows") else []
+
+
+# Envelope of an execute_sql result with its rows re-encoded in the requested format
+def encode_result(result: dict, result_format: str = SQL_RESULT_FORMAT) -> dict:
+    if "rows" not in result:
+        return result
+    columns = _columns(result)
+    envelope = {k: v for k, v in result.items() if k != "rows"}
+    if result_format == "columns":
+        raw = [[row.get(c) for row in result["rows"]] for c in columns]
+        envelope["columns"] = columns
+        envelope["types"] = [column_type(values) for values in raw]
+        envelope["values"] = [[encode_value(v) for v in values] for values in raw]
+    else:
+        envelope["rows"] = [{c: encode_value(row.get(c)) for c in columns} for row in result["rows"]]
+    envelope["format"] = result_format
+    return envelope
+
+
+# count / nulls / distinct, min and max for ordered types, mean for numbers, and the most common values
+# unless every value is distinct
+def summarize_column(values: list, kind: str, top_n: int = SQL_SUMMARY_TOP_N) -> dict:
+    present = [v for v in values if v is not None]
+    stats = {"type": kind, "count": len(present), "nulls": len(values) - len(present)}
+    hashable = [json.dumps(v, sort_keys=True, default=json_default) if isinstance(v, (dict, list)) else v
+                for v in present]
+    counts = Counter(hashable)
+    stats["distinct"] = len(counts)
+    if present and kind in ("integer", "number", "timestamp", "date", "time", "interval_seconds", "text"):
+        try:
+            stats["min"] = encode_value(min(present))
+            stats["max"] = encode_value(max(present))
+        except TypeError:
+            # Mixed value types in one column have no ordering
+            pass
+    if present and kind in ("integer", "number"):
+        stats["mean"] = encode_value(sum(float(v) for v in present) / len(present))
+    if top_n and counts and len(counts) < len(present):
+        stats["top"] = [[encode_value(v), n] for v, n in counts.most_common(top_n)]
+    return stats
+
+
+def summarize_result(result: dict, token_budget: int, top_n: int = SQL_SUMMARY_TOP_N,
+                     sample_rows: int = SQL_SUMMARY_SAMPLE_ROWS) -> dict:
+    columns = _columns(result)
+    raw = {c: [row.get(c) for row in result["rows"]] for c in columns}
+    envelope = {k: v for k, v in result.items() if k != "rows"}
+    envelope.update(
+        format="summary",
+        columns=columns,
+        summary={c: summarize_column(values, column_type(values), top_n) for c, values in raw.items()},
+        sample=[[encode_value(row.get(c)) for c in columns] for row in result["rows"][:sample_rows]],
+        note=f"The result was over the {token_budget}-token budget, so it is summarized: per-column statistics "
+             f"over all {len(result['rows'])} fetched rows and the first {min(sample_rows, len(result['rows']))} "
+             f"rows as a sample. Aggregate or filter in SQL for exact figures.",
+    )
+    return envelope
+
+
+# Encoded result, or its summary if the encoded form is over the token budget (0 or summarize=False keeps it)
+def shape_result(result: dict, result_format: str = SQL_RESULT_FORMAT, summarize: bool = True,
+                 token_budget: int = SQL_RESULT_TOKEN_BUDGET) -> dict:
+    if "rows" not in result:
+        return result
+    encoded = encode_result(result, result_format)
+    if summarize and token_budget and result["rows"]:
+        tokens = estimate_tokens(json.dumps(encoded))
+        if tokens > token_budget:
+            summary = summarize_result(result, token_budget)
+            summary["result_tokens"] = tokens
+            return summary
+    return encoded
+
+
+# Rows as dicts from any of the payload formats (the summary's sample rows for a summary)
+def result_rows(result) -> list:
+    if not isinstance(result, dict):
+        return result or []
+    if "rows" in result:
+        return result["rows"]
+    columns = result.get("columns") or []
+    if "values" in result:
+        return [dict(zip(columns, row)) for row in zip(*result["values"])]
+    return [dict(zip(columns, row)) for row in result.get("sample", [])]
@@ -0,0 +1,324 @@
+## Retrieval benchmark for schema_rag - recall@k, context size and latency over a labeled question set
+
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import requests
+from dotenv import load_dotenv
+load_dotenv()
+
+import schema_rag
+from embedding_backends import HashingEmbedder
+from embedding_cache import QueryEmbeddingCache
+from embedding_client import OLLAMA_URL, OllamaEmbeddingClient
+
+QUESTIONS_PATH = "data/retrieval_questions.json"
+README_PATH = "README.md"
+STUB_DIM = 256
+
+# Values substituted for the placeholders in the README's supported queries
+PLACEHOLDERS = {
+    "<REPO_NAME>": "augur",
+    "<REPO_ID>": "1",
+    "<REPO_GROUP_ID>": "1",
+    "<PROJECT_OR_ID>": "augur",
+}
+
+# Expected schema for each README query, keyed by the query as written there
+README_LABELS = {
+    "What is the repo id for `<REPO_NAME>`?":
+        (["repo"], ["repo.repo_id", "repo.repo_name"]),
+    "Show me the last update timestamp for repository `<REPO_ID>`.":
+        (["repo_info"], ["repo_info.repo_id"]),
+    "What is the repo group id for `<REPO_NAME>`?":
+        (["repo"], ["repo.repo_group_id", "repo.repo_name"]),
+    "Which repos are part of rg `<REPO_GROUP_ID>`?":
+        (["repo"], ["repo.repo_group_id", "repo.repo_name"]),
+    "Who are the distinct cmt authors to repo id `<REPO_ID>`?":
+        (["commits"], ["commits.cmt_author_email", "commits.repo_id"]),
+    "Who is the top author to repo `<REPO_ID>`?":
+        (["commits"], ["commits.cmt_author_email", "commits.repo_id"]),
+    "Which contributors from Red Hat have worked on `<PROJECT_OR_ID>`?":
+        (["commits", "repo"], ["commits.cmt_author_email", "repo.repo_name"]),
+    "get_contributor_affiliations, project `<PROJECT_OR_ID>`, company Red Hat":
+        (["commits", "repo"], ["commits.cmt_author_email", "repo.repo_name"]),
+    "How many open issues are in repo `<REPO_ID>`?":
+        (["issues"], ["issues.closed_at", "issues.repo_id"]),
+    "How many issues were opened in repo `<REPO_ID>` in June 2025?":
+        (["issues"], ["issues.created_at", "issues.repo_id"]),
+    "Which repos haven’t been updated in over 90 days?":
+        (["repo_info"], ["repo_info.repo_id"]),
+    "What are the programming languages used in repo `<REPO_ID>`?":
+        (["explorer_repo_languages"], ["explorer_repo_languages.programming_language", "explorer_repo_languages.repo_id"]),
+    "List the repo names that use Java.":
+        (["explorer_repo_languages"], ["explorer_repo_languages.programming_language", "explorer_repo_languages.repo_name"]),
+}
+
+
+# Bullet points under the README's "Supported Queries" heading
+def readme_queries(path: str = README_PATH) -> list:
+    with open(path, "r") as f:
+        text = f.read()
+    section = text.split("## Supported Queries", 1)[-1].split("\n## ", 1)[0]
+    return [line[2:].strip() for line in section.splitlines() if line.startswith("- ")]
+
+
+def fill_placeholders(query: str) -> str:
+    for placeholder, value in PLACEHOLDERS.items():
+        query = query.replace(f"`{placeholder}`", value).replace(placeholder, value)
+    return query
+
+
+# README queries (labels from README_LABELS) plus each table's common_questions (labeled with that table);
+# entries marked "manual" in an existing question file are carried over
+def seed_questions(path: str = QUESTIONS_PATH) -> list:
+    questions = []
+    for query in readme_queries():
+        tables, columns = README_LABELS.get(query, ([], []))
+        questions.append({"question": fill_placeholders(query), "tables": tables, "columns": columns, "source": "readme"})
+    with open(schema_rag.SCHEMA_PATH, "r") as f:
+        schema = json.load(f)
+    for table, meta in schema["tables"].items():
+        for question in meta.get("common_questions", []):
+            questions.append({"question": question, "tables": [table], "columns": [], "source": f"schema:{table}"})
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            questions.extend(q for q in json.load(f)["questions"] if q.get("source") == "manual")
+
+    # The same phrase can appear under several tables ("repositories by organization"); merge the labels
+    merged = {}
+    for q in questions:
+        entry = merged.setdefault(q["question"], {**q, "tables": [], "columns": []})
+        entry["tables"] += [t for t in q["tables"] if t not in entry["tables"]]
+        entry["columns"] += [c for c in q["columns"] if c not in entry["columns"]]
+    return list(merged.values())
+
+
+# Local server speaking Ollama's embedding API: "stub" hashes texts with HashingEmbedder, "replay" serves a
+# recorded fixture, "record" forwards to a real Ollama server and saves every vector it returns into the fixture
+class EmbeddingStubServer:
+    def __init__(self, mode: str = "stub", fixture_path: str = None, upstream: str = OLLAMA_URL):
+        self.mode = mode
+        self.fixture_path = fixture_path
+        self.upstream = upstream.rstrip("/")
+        self.vectors = {}
+        self.missing = set()
+        self.hashing = HashingEmbedder(dim=STUB_DIM)
+        self._lock = threading.Lock()
+        if mode == "replay":
+            with open(fixture_path, "r") as f:
+                self.vectors = json.load(f)["embeddings"]
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or "{}")
+                if self.path == "/api/embed":
+                    texts = payload.get("input", [])
+                    texts = [texts] if isinstance(texts, str) else texts
+                    status, body = server.embed(payload.get("model"), texts, "embeddings")
+                elif self.path == "/api/embeddings":
+                    status, body = server.embed(payload.get("model"), [payload.get("prompt", "")], "embedding")
+                else:
+                    status, body = 404, {"error": "not found"}
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def embed(self, model: str, texts: list, field: str):
+        if self.mode == "stub":
+            vectors = self.hashing.embed(texts)
+        elif self.mode == "record":
+            response = requests.post(f"{self.upstream}/api/embed", json={"model": model, "input": texts}, timeout=120)
+            if response.status_code != 200:
+                return response.status_code, {"error": response.text}
+            vectors = response.json()["embeddings"]
+            with self._lock:
+                self.vectors.update(zip(texts, vectors))
+        else:
+            missing = [text for text in texts if text not in self.vectors]
+            if missing:
+                with self._lock:
+                    self.missing.update(missing)
+                # 400 rather than 404/5xx so the client neither falls back nor retries
+                return 400, {"error": f"{len(missing)} text(s) not in fixture {self.fixture_path}; re-record it"}
+            vectors = [self.vectors[text] for text in texts]
+        return 200, {field: vectors if field == "embeddings" else vectors[0]}
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.mode == "record":
+            with open(self.fixture_path, "w") as f:
+                json.dump({"model": schema_rag.MODEL_NAME, "embeddings": self.vectors}, f)
+            print(f"Recorded {len(self.vectors)} embeddings to {self.fixture_path}")
+
+
+# Nearest-rank percentile of an already sorted list
+def percentile(values: list, p: float) -> float:
+    return values[min(len(values) - 1, max(0, int(np.ceil(p / 100 * len(values))) - 1))]
+
+
+def recall(expected: list, found: set):
+    return sum(1 for item in expected if item in found) / len(expected) if expected else None
+
+
+def benchmark(questions: list, table_k: int, column_k: int, repeat: int, budget: int = 0,
+              include_types: bool = False) -> dict:
+    index = schema_rag.SchemaIndex(table_k=table_k, column_k=column_k)
+    results = []
+    latencies = []
+    for q in questions:
+        lexical_before = index.lexical_only
+        for _ in range(repeat):
+            start = time.perf_counter()
+            context = index.build_context(q["question"], budget=budget, include_types=include_types)
+            latencies.append(1000 * (time.perf_counter() - start))
+        selection = context.selection
+        tables = set(selection)
+        columns = {f"{t}.{c}" for t, cols in selection.items() for c in cols}
+        results.append({
+            **q,
+            "retrieved_tables": sorted(tables),
+            "missed_tables": [t for t in q["tables"] if t not in tables],
+            "missed_columns": [c for c in q["columns"] if c not in columns],
+            "table_recall": recall(q["tables"], tables),
+            "column_recall": recall(q["columns"], columns),
+            "context_tokens": context.tokens,
+            "dropped_columns": context.dropped_columns,
+            "lexical_only": index.lexical_only > lexical_before,
+        })
+
+    def mean(field):
+        values = [r[field] for r in results if r[field] is not None]
+        return statistics.mean(values) if values else None
+
+    latencies.sort()
+    tokens = [r["context_tokens"] for r in results]
+    summary = {
+        "questions": len(results),
+        "table_k": table_k,
+        "column_k": column_k,
+        "budget": budget,
+        "table_recall": mean("table_recall"),
+        "column_recall": mean("column_recall"),
+        "column_labeled": sum(1 for r in results if r["column_recall"] is not None),
+        "context_tokens_mean": statistics.mean(tokens),
+        "context_tokens_max": max(tokens),
+        "dropped_columns": sum(len(r["dropped_columns"]) for r in results),
+        "lexical_only": sum(1 for r in results if r["lexical_only"]),
+        "latency_ms_p50": percentile(latencies, 50),
+        "latency_ms_p95": percentile(latencies, 95),
+        "latency_ms_p99": percentile(latencies, 99),
+    }
+    return {"summary": summary, "results": results}
+
+
+def print_report(report: dict, show_misses: int):
+    s = report["summary"]
+    print(f"Questions:      {s['questions']} (table_k={s['table_k']}, column_k={s['column_k']}, "
+          f"budget={s['budget'] or 'none'})")
+    print(f"Table recall:   {s['table_recall']:.3f}")
+    if s["column_recall"] is not None:
+        print(f"Column recall:  {s['column_recall']:.3f} over {s['column_labeled']} column-labeled questions")
+    print(f"Context tokens: mean {s['context_tokens_mean']:.0f}, max {s['context_tokens_max']}, "
+          f"{s['dropped_columns']} columns dropped for budget")
+    print(f"Lexical only:   {s['lexical_only']} of {s['questions']} questions skipped the embedding call")
+    print(f"Latency:        p50 {s['latency_ms_p50']:.1f} ms, p95 {s['latency_ms_p95']:.1f} ms, "
+          f"p99 {s['latency_ms_p99']:.1f} ms")
+    misses = [r for r in report["results"] if r["missed_tables"] or r["missed_columns"]]
+    if misses and show_misses:
+        print(f"\nMisses ({len(misses)}):")
+        for r in misses[:show_misses]:
+            missed = r["missed_tables"] + r["missed_columns"]
+            print(f"  {r['question']!r}: missed {', '.join(missed)} (got {', '.join(r['retrieved_tables'])})")
+
+
+def run(args):
+    with open(args.questions, "r") as f:
+        questions = json.load(f)["questions"]
+
+    # Every query is embedded fresh, so latency reflects a first-time question rather than a cache hit
+    schema_rag.query_cache = QueryEmbeddingCache(max_size=0, path="")
+
+    mode = "stub" if args.stub else "replay" if args.fixture else "record" if args.record else None
+    if mode is None and schema_rag.EMBED_BACKEND == "ollama":
+        report = benchmark(questions, args.table_k, args.column_k, args.repeat, args.budget, args.types)
+    else:
+        # Offline and recording runs embed the schema into a scratch directory so the stores match the embedder
+        with contextlib.ExitStack() as stack:
+            tmp = stack.enter_context(tempfile.TemporaryDirectory())
+            if mode:
+                server = stack.enter_context(EmbeddingStubServer(mode, args.fixture or args.record))
+                schema_rag._embedder = OllamaEmbeddingClient(schema_rag.EMBED_MODEL, base_url=server.url)
+                schema_rag.MODEL_NAME = schema_rag._embedder.model
+            schema_rag.COLUMN_EMBED_PATH = os.path.join(tmp, "columns")
+            schema_rag.TABLE_EMBED_PATH = os.path.join(tmp, "tables")
+            try:
+                schema_rag.embed_and_save(full=True)
+                report = benchmark(questions, args.table_k, args.column_k, args.repeat, args.budget, args.types)
+            except requests.HTTPError:
+                if mode == "replay" and server.missing:
+                    raise SystemExit(f"{len(server.missing)} text(s) missing from {args.fixture}, e.g. "
+                                     f"{next(iter(server.missing))!r}; re-record with --record")
+                raise
+    report["summary"]["embeddings"] = mode or schema_rag.EMBED_BACKEND
+
+    print_report(report, args.show_misses)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote per-question results to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark schema retrieval against a labeled question set")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed = commands.add_parser("seed", help="Build the question set from the README and the schema's common_questions")
+    seed.add_argument("--questions", default=QUESTIONS_PATH, help="Question set to write")
+
+    bench = commands.add_parser("run", help="Run the question set against the retriever")
+    bench.add_argument("--questions", default=QUESTIONS_PATH, help="Labeled question set")
+    source = bench.add_mutually_exclusive_group()
+    source.add_argument("--stub", action="store_true", help="Embed offline with a local hashing stub server")
+    source.add_argument("--fixture", help="Embed offline from a recorded-embedding fixture")
+    source.add_argument("--record", help="Embed through Ollama and record every vector to this fixture")
+    bench.add_argument("--table-k", type=int, default=5, help="Tables kept by the first retrieval pass")
+    bench.add_argument("--column-k", type=int, default=10, help="Columns kept from the selected tables")
+    bench.add_argument("--budget", type=int, default=schema_rag.CONTEXT_TOKEN_BUDGET,
+                       help="Schema context token budget (0 for none)")
+    bench.add_argument("--types", action="store_true", help="Include column types in the context")
+    bench.add_argument("--repeat", type=int, default=1, help="Timed retrievals per question")
+    bench.add_argument("--show-misses", type=int, default=10, help="Missed questions to list (0 for none)")
+    bench.add_argument("--output", help="Write the summary and per-question results as JSON")
+    args = parser.parse_args()
+
+    if args.command == "seed":
+        questions = seed_questions(args.questions)
+        with open(args.questions, "w") as f:
+            json.dump({"questions": questions}, f, indent=2, ensure_ascii=False)
+        print(f"Wrote {len(questions)} questions to {args.questions}")
+    else:
+        run(args)
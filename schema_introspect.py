@@ -0,0 +1,192 @@
+## Schema introspection - builds or updates augur_schema.json from the live Postgres catalog.
+## Types, keys, indexes and row estimates come from the database; hand-written descriptions, aliases
+## and patterns already in the file are kept
+
+import argparse
+import copy
+import json
+import logging
+import os
+from db_pool import get_pool
+from schema_rag import SCHEMA_PATH
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_NAME = "augur_data"
+
+TABLES_SQL = """
+    SELECT c.relname, c.reltuples::bigint, pg_total_relation_size(c.oid), obj_description(c.oid, 'pg_class')
+    FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = %s AND c.relkind IN ('r', 'p', 'v', 'm') AND NOT c.relispartition
+    ORDER BY c.relname
+"""
+
+COLUMNS_SQL = """
+    SELECT c.relname, a.attname, format_type(a.atttypid, a.atttypmod), NOT a.attnotnull, col_description(c.oid, a.attnum)
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_attribute a ON a.attrelid = c.oid
+    WHERE n.nspname = %s AND c.relkind IN ('r', 'p', 'v', 'm') AND NOT c.relispartition
+      AND a.attnum > 0 AND NOT a.attisdropped
+    ORDER BY c.relname, a.attnum
+"""
+
+# Primary and foreign keys, with their columns in key order
+CONSTRAINTS_SQL = """
+    SELECT c.relname, con.contype,
+           ARRAY(SELECT a.attname FROM unnest(con.conkey) WITH ORDINALITY AS k(attnum, i)
+                 JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum ORDER BY k.i),
+           fn.nspname, fc.relname,
+           ARRAY(SELECT a.attname FROM unnest(con.confkey) WITH ORDINALITY AS k(attnum, i)
+                 JOIN pg_attribute a ON a.attrelid = con.confrelid AND a.attnum = k.attnum ORDER BY k.i)
+    FROM pg_constraint con
+    JOIN pg_class c ON c.oid = con.conrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    LEFT JOIN pg_class fc ON fc.oid = con.confrelid
+    LEFT JOIN pg_namespace fn ON fn.oid = fc.relnamespace
+    WHERE n.nspname = %s AND con.contype IN ('p', 'f')
+    ORDER BY c.relname, con.conname
+"""
+
+# Index columns in index order; expression columns (attnum 0) are left out
+INDEXES_SQL = """
+    SELECT t.relname, i.relname, ix.indisunique,
+           ARRAY(SELECT a.attname FROM unnest(ix.indkey::int2[]) WITH ORDINALITY AS k(attnum, i)
+                 JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum ORDER BY k.i)
+    FROM pg_index ix
+    JOIN pg_class t ON t.oid = ix.indrelid
+    JOIN pg_class i ON i.oid = ix.indexrelid
+    JOIN pg_namespace n ON n.oid = t.relnamespace
+    WHERE n.nspname = %s
+    ORDER BY t.relname, i.relname
+"""
+
+
+# table -> {row_estimate, size_bytes, comment, columns: [(name, type, nullable, comment)], primary_key,
+# foreign_keys: {column: "table.column"}, indexes: [{name, columns, unique}]}
+def read_catalog(conn, schema_name: str = SCHEMA_NAME) -> dict:
+    catalog = {}
+    with conn.cursor() as cursor:
+        cursor.execute(TABLES_SQL, (schema_name,))
+        for table, reltuples, size_bytes, comment in cursor.fetchall():
+            catalog[table] = {
+                # reltuples is -1 until the table has been vacuumed or analyzed
+                "row_estimate": reltuples if reltuples >= 0 else None,
+                "size_bytes": size_bytes,
+                "comment": comment,
+                "columns": [],
+                "primary_key": [],
+                "foreign_keys": {},
+                "indexes": [],
+            }
+        cursor.execute(COLUMNS_SQL, (schema_name,))
+        for table, column, data_type, nullable, comment in cursor.fetchall():
+            catalog[table]["columns"].append((column, data_type, nullable, comment))
+        cursor.execute(CONSTRAINTS_SQL, (schema_name,))
+        for table, kind, columns, ref_schema, ref_table, ref_columns in cursor.fetchall():
+            if table not in catalog:
+                continue
+            if kind == "p":
+                catalog[table]["primary_key"] = list(columns)
+            # Only single-column keys into this schema become references the join graph can use
+            elif ref_schema == schema_name and len(columns) == 1:
+                catalog[table]["foreign_keys"][columns[0]] = f"{ref_table}.{ref_columns[0]}"
+        cursor.execute(INDEXES_SQL, (schema_name,))
+        for table, index, unique, columns in cursor.fetchall():
+            if table in catalog and columns:
+                catalog[table]["indexes"].append({"name": index, "columns": list(columns), "unique": unique})
+    return catalog
+
+
+# Catalog facts merged into the schema file. Hand-written fields win over catalog comments; the catalog type
+# goes in data_type, leaving any hand-written type label alone; a column counts as indexed when it leads an
+# index, since that is what makes `WHERE column = ...` cheap
+def merge_schema(schema: dict, catalog: dict, tables: list = None, existing_only: bool = False):
+    merged = copy.deepcopy(schema)
+    merged.setdefault("tables", {})
+    summary = {"tables_added": [], "tables_updated": [], "columns_added": 0, "missing_tables": [],
+               "missing_columns": []}
+
+    for table, facts in catalog.items():
+        if tables and table not in tables:
+            continue
+        entry = merged["tables"].get(table)
+        if entry is None:
+            if existing_only:
+                continue
+            entry = merged["tables"][table] = {"description": facts["comment"] or "", "columns": {}}
+            summary["tables_added"].append(table)
+        else:
+            summary["tables_updated"].append(table)
+
+        entry["row_estimate"] = facts["row_estimate"]
+        entry["size_bytes"] = facts["size_bytes"]
+        entry["primary_key"] = facts["primary_key"]
+        entry["indexes"] = facts["indexes"]
+        leading = {index["columns"][0] for index in facts["indexes"]}
+
+        columns = entry.setdefault("columns", {})
+        for column, data_type, nullable, comment in facts["columns"]:
+            meta = columns.get(column)
+            if meta is None:
+                meta = columns[column] = {}
+                if comment:
+                    meta["description"] = comment
+                summary["columns_added"] += 1
+            meta["data_type"] = data_type
+            meta["nullable"] = nullable
+            meta["indexed"] = column in leading
+            if column in facts["foreign_keys"] and "references" not in meta:
+                meta["references"] = facts["foreign_keys"][column]
+        catalog_columns = {column for column, *_ in facts["columns"]}
+        summary["missing_columns"] += [f"{table}.{c}" for c in columns if c not in catalog_columns]
+
+    summary["missing_tables"] = [t for t in merged["tables"] if t not in catalog and (not tables or t in tables)]
+    return merged, summary
+
+
+def introspect(path: str = SCHEMA_PATH, output: str = None, tables: list = None, existing_only: bool = False,
+               dry_run: bool = False) -> dict:
+    with open(path, "r") as f:
+        schema = json.load(f)
+    with get_pool().connection() as conn:
+        catalog = read_catalog(conn)
+    merged, summary = merge_schema(schema, catalog, tables, existing_only)
+
+    # Kept, not dropped: they may be hand-written for a newer Augur than this database
+    for name in summary["missing_tables"]:
+        logger.warning(f"Table {name} is in {path} but not in the {SCHEMA_NAME} catalog; keeping it")
+    for name in summary["missing_columns"]:
+        logger.warning(f"Column {name} is in {path} but not in the {SCHEMA_NAME} catalog; keeping it")
+
+    if not dry_run:
+        output = output or path
+        tmp_path = f"{output}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(merged, f, indent=2)
+            f.write("\n")
+        os.replace(tmp_path, output)
+    return summary
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description=f"Build or update the schema file from the live {SCHEMA_NAME} catalog")
+    parser.add_argument("--schema", default=SCHEMA_PATH, help="Schema file to update")
+    parser.add_argument("--output", help="Write here instead of overwriting --schema")
+    parser.add_argument("--tables", help="Comma-separated tables to introspect (default: all)")
+    parser.add_argument("--existing-only", action="store_true", help="Only refresh tables already in the file")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    args = parser.parse_args()
+
+    tables = [t.strip() for t in args.tables.split(",")] if args.tables else None
+    summary = introspect(args.schema, args.output, tables, args.existing_only, args.dry_run)
+    print(f"Updated {len(summary['tables_updated'])} tables, added {len(summary['tables_added'])} tables "
+          f"and {summary['columns_added']} columns"
+          + (" (dry run, nothing written)" if args.dry_run else f" in {args.output or args.schema}"))
+    if summary["tables_added"]:
+        print(f"New tables: {', '.join(summary['tables_added'])}")
+    if not args.dry_run:
+        print("Run `python schema_rag.py embed` to re-embed the changed descriptions")
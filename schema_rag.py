@@ -1,18 +1,45 @@
-## Code to embed database schema and store in a pkl
+## Code to embed database schema and store it in a memory-mappable embedding store
 
+import hashlib
 import json
-import pickle
-import requests
+import os
 import re
-from sklearn.neighbors import NearestNeighbors
+import threading
+import numpy as np
+from dataclasses import dataclass, field
 from typing import List, Tuple
+from embedding_backends import Embedder, HashingEmbedder
+from embedding_cache import QueryEmbeddingCache
+from embedding_client import OllamaEmbeddingClient
+from join_graph import JoinGraph
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from metrics import CACHE_LOOKUPS
+from token_estimate import estimate_tokens
+from tracing import span
+from embedding_store import content_hash, convert_pickle, load_store, save_store, store_exists, store_paths
+from dotenv import load_dotenv
+load_dotenv()
 
-OLLAMA_URL = "http://localhost:11434/api/embeddings"
-MODEL_NAME = "nomic-embed-text"
+# "ollama" embeds over HTTP with EMBED_MODEL; "hashing" embeds in-process with no network (embedding_backends.py)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "ollama")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "nomic-embed-text")
 SCHEMA_PATH = "data/augur_schema.json"
-COLUMN_EMBED_PATH = "data/augur_column_embeddings.pkl"
+# Store base paths; each store is <base>.npy plus <base>.meta.json (see embedding_store.py). The checked-in
+# column store is Ollama's, so other backends write theirs under their own, untracked, names
+EMBED_STORE_SUFFIX = "" if EMBED_BACKEND == "ollama" else f"_{EMBED_BACKEND}"
+COLUMN_EMBED_PATH = f"data/augur_column_embeddings{EMBED_STORE_SUFFIX}"
+TABLE_EMBED_PATH = f"data/augur_table_embeddings{EMBED_STORE_SUFFIX}"
+LEGACY_COLUMN_PKL_PATH = "data/augur_column_embeddings.pkl"
 
-JOIN_PATHS = {
+# Prompt budget for the schema context in estimated tokens (0 for no limit), and whether to list column types
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "150"))
+CONTEXT_INCLUDE_TYPES = os.getenv("CONTEXT_INCLUDE_TYPES", "false").lower() in ("1", "true", "yes")
+# Mark indexed columns and table row estimates in the context (needs a schema built by schema_introspect.py)
+CONTEXT_INCLUDE_STATS = os.getenv("CONTEXT_INCLUDE_STATS", "true").lower() in ("1", "true", "yes")
+
+# "Possible joins" hints in the embedded column descriptions. The checked-in column store was embedded from this
+# text, so edit it together with `schema_rag.py embed`; the joins added to the context come from join_graph.py
+DESCRIPTION_JOINS = {
     ("commits",      "repo_id"): ["repo"],
     ("repo_info",    "repo_id"): ["repo"],
     ("repo_labor",   "repo_id"): ["repo"],
@@ -45,108 +72,431 @@ def load_schema_for_columns():
         for column_name, col_meta in columns.items():
             key = f"{table_name}.{column_name}"
             meaning = col_meta.get("description", infer_column_meaning(column_name, table_name))
-            joins = JOIN_PATHS.get((table_name, column_name), [])
+            joins = DESCRIPTION_JOINS.get((table_name, column_name), [])
             join_str = f" Possible joins: {', '.join(joins)}" if joins else ""
             full_desc = f"{key} — {meaning}. Table context: {table_desc}.{join_str}"
             column_descriptions.append(full_desc)
             column_keys.append((table_name, column_name))
     return column_keys, column_descriptions
 
+# Table-level descriptions used for the first retrieval pass
+def load_schema_for_tables():
+    with open(SCHEMA_PATH, "r") as f:
+        schema = json.load(f)
+    table_keys = list(schema["tables"].keys())
+    table_descriptions = [f"Table {t}: {meta.get('description', '')}" for t, meta in schema["tables"].items()]
+    return table_keys, table_descriptions
+
+# Hash of the schema file, stored with the table index so edits to the JSON trigger a rebuild
+def schema_fingerprint() -> str:
+    with open(SCHEMA_PATH, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def make_embedder(backend: str = EMBED_BACKEND) -> Embedder:
+    if backend == "ollama":
+        return OllamaEmbeddingClient(EMBED_MODEL)
+    if backend == "hashing":
+        return HashingEmbedder()
+    raise ValueError(f"Unknown EMBED_BACKEND {backend!r}, expected 'ollama' or 'hashing'")
+
+# One embedder per process (see embedding_client.py for the Ollama batch/worker/retry settings)
+_embedder = make_embedder()
+MODEL_NAME = _embedder.model
+
+def get_embedder() -> Embedder:
+    return _embedder
+
 # Store embeddings in a list
 def get_embeddings(texts: List[str]) -> List[List[float]]:
-    embeddings = []
-    for text in texts:
-        response = requests.post(
-            OLLAMA_URL,
-            json={"model": MODEL_NAME, "prompt": text},
-            headers={"Content-Type": "application/json"}
-        )
-        response.raise_for_status()
-        embeddings.append(response.json()["embedding"])
-    return embeddings
+    return get_embedder().embed(texts)
 
-# Filtering and "choosing tables and columns" logic using KNN and cosine similarity
-def get_schema_context(query: str) -> str:
-    with open(SCHEMA_PATH, "r") as f:
-        schema = json.load(f)
+# Questions repeat a lot, so query embeddings go through a per-process LRU (+ optional disk) cache
+query_cache = QueryEmbeddingCache()
 
-    table_descriptions = [f"Table {t}: {meta.get('description', '')}" for t, meta in schema["tables"].items()]
-    table_keys = list(schema["tables"].keys())
-    table_embeddings = get_embeddings(table_descriptions)
-    query_embedding = get_embeddings([query])[0]
+def embed_query(query: str) -> np.ndarray:
+    vector = query_cache.get(query, MODEL_NAME)
+    CACHE_LOOKUPS.inc(cache="query_embedding", result="miss" if vector is None else "hit")
+    if vector is None:
+        vector = query_cache.put(query, MODEL_NAME, get_embeddings([query])[0])
+    return vector
 
-    table_knn = NearestNeighbors(n_neighbors=min(5, len(table_embeddings)), metric="cosine")
-    table_knn.fit(table_embeddings)
-    _, table_indices = table_knn.kneighbors([query_embedding])
-    selected_tables = set([table_keys[i] for i in table_indices[0]])
+# Save a store at `base`, embedding only descriptions whose content hash is not already stored there
+def embed_incremental(base: str, keys: list, descriptions: List[str], dtype: str = "float32",
+                      full: bool = False, **extra):
+    stored_vectors = {}
+    stored_keys = set()
+    if not full and store_exists(base):
+        old = load_store(base)
+        # Vectors from another backend or model, or a lossier dtype, cannot be reused
+        if store_embedder(old) == (_embedder.backend, MODEL_NAME) and old.header["dtype"] == dtype:
+            stored_keys = set(old.keys)
+            stored_vectors = {content_hash(d): np.array(old.matrix[i]) for i, d in enumerate(old.descriptions)}
 
-    with open(COLUMN_EMBED_PATH, "rb") as f:
-        column_embeddings, column_keys, column_descriptions = pickle.load(f)
+    hashes = [content_hash(d) for d in descriptions]
+    to_embed = list(dict.fromkeys(h for h in hashes if h not in stored_vectors))
+    text_for_hash = dict(zip(hashes, descriptions))
+    stored_vectors.update(zip(to_embed, get_embeddings([text_for_hash[h] for h in to_embed])))
 
-## Use column descriptions and embeddings to match schema to query
-    filtered = [
-        (i, key, column_descriptions[i], column_embeddings[i])
-        for i, key in enumerate(column_keys)
-        if key[0] in selected_tables
-    ]
-
-    if not filtered:
-        return "No matching schema found."
-
-## identifies relevant list of columns for selected tables
-
-    table_column_map = {table: [] for table in selected_tables}
-    for t in list(table_column_map.keys()):
-        cols = table_column_map[t]
-        # Keep only the top 3 semantically relevant columns
-        table_column_map[t] = cols[:3]
-    filtered_keys = [key for _, key, _, _ in filtered]
-    filtered_embs = [vec for _, _, _, vec in filtered]
-# Using cosine similarity, find the top 15 relevant cols to user query
-    col_knn = NearestNeighbors(n_neighbors=min(10, len(filtered_embs)), metric="cosine")
-    col_knn.fit(filtered_embs)
-    _, col_indices = col_knn.kneighbors([query_embedding])
-
-    # add context to map
-    additional_tables = set()
-    for idx in col_indices[0]:
-        t, c = filtered_keys[idx]
-        table_column_map[t].append(c)
-        join_paths = JOIN_PATHS.get((t, c), [])
-        additional_tables.update(join_paths)
-
-    for table in additional_tables:
-        if table not in table_column_map and table in schema["tables"]:
-            columns = list(schema["tables"][table]["columns"].keys())
-            table_column_map[table] = columns[:6]
+    store = save_store(base, [stored_vectors[h] for h in hashes], keys, descriptions, MODEL_NAME,
+                       dtype=dtype, backend=_embedder.backend, **extra)
+    summary = {
+        "reused": sum(1 for h in hashes if h not in to_embed),
+        "added": sum(1 for h in hashes if h in to_embed),
+        "removed": len(stored_keys - set(keys)),
+    }
+    return store, summary
+
+# Embed table descriptions and save them with the schema fingerprint
+def embed_and_save_tables(dtype: str = "float32", full: bool = False):
+    table_keys, table_descriptions = load_schema_for_tables()
+    return embed_incremental(TABLE_EMBED_PATH, table_keys, table_descriptions, dtype=dtype, full=full,
+                             schema_fingerprint=schema_fingerprint())
+
+# (backend, model) a store was embedded with; stores written before backends were pluggable are Ollama's
+def store_embedder(store) -> tuple:
+    return store.header.get("backend", "ollama"), store.model
+
+# Load a store and refuse it if it was built with a different embedding backend or model
+def load_embedding_store(base: str):
+    store = load_store(base)
+    if store_embedder(store) != (_embedder.backend, MODEL_NAME):
+        backend, model = store_embedder(store)
+        raise ValueError(f"{base} was embedded with {backend}/{model} but {_embedder.backend}/{MODEL_NAME} "
+                         f"is configured; re-run embed")
+    return store
+
+# Load the persisted table index, rebuilding it if missing or built from an older schema
+def load_table_embeddings():
+    if store_exists(TABLE_EMBED_PATH):
+        store = load_embedding_store(TABLE_EMBED_PATH)
+        if store.header.get("schema_fingerprint") == schema_fingerprint():
+            return store
+        print(f"{SCHEMA_PATH} changed since {TABLE_EMBED_PATH} was built, re-embedding tables...")
+    store, _ = embed_and_save_tables()
+    return store
 
+# Load the persisted column index. Only `embed` writes it, so descriptions the schema has changed since are
+# reported rather than re-embedded here
+def load_column_embeddings():
+    store = load_embedding_store(COLUMN_EMBED_PATH)
+    _, column_descriptions = load_schema_for_columns()
+    stored = set(store.descriptions)
+    stale = sum(1 for d in column_descriptions if d not in stored)
+    if stale:
+        print(f"{stale} column descriptions in {SCHEMA_PATH} changed since {COLUMN_EMBED_PATH} was built; "
+              f"run `python schema_rag.py embed` to re-embed them")
+    return store
+
+# L2-normalize rows so cosine similarity is a plain dot product
+def normalize_rows(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+# Indices of the k highest scores, best first, using a partial sort
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+# "1.2M" style row counts
+def format_count(count: int) -> str:
+    for unit, size in (("B", 1e9), ("M", 1e6), ("k", 1e3)):
+        if count >= size:
+            return f"{count / size:.1f}".rstrip("0").rstrip(".") + unit
+    return str(count)
+
+# One line per table, columns unqualified since the table heads the line; adding augur_data prefix so sql
+# will execute. Optionally each column is followed by its type (the catalog's data_type, else the hand-written
+# type label), and with stats indexed columns are starred and each table gets its row estimate, so the model
+# filters big tables on a cheap key
+def format_schema_context(table_column_map: dict, schema: dict = None, include_types: bool = False,
+                          include_stats: bool = False) -> str:
     schema_lines = []
-    ## adding augur_data prefix so sql will execute
+    starred = False
     for table, columns in table_column_map.items():
         if columns:
-            column_list = ", ".join([f"{table}.{col}" for col in columns])
-            schema_lines.append(f"augur_data.{table}({column_list})")
-
+            table_meta = schema["tables"].get(table, {}) if schema is not None else {}
+            column_meta = table_meta.get("columns", {})
+            parts = []
+            for col in columns:
+                meta = column_meta.get(col, {})
+                part = col
+                if include_stats and meta.get("indexed"):
+                    part += "*"
+                    starred = True
+                column_type = meta.get("data_type") or meta.get("type")
+                if include_types and column_type:
+                    part += f" {column_type}"
+                parts.append(part)
+            line = f"augur_data.{table}({', '.join(parts)})"
+            if include_stats and table_meta.get("row_estimate") is not None:
+                line += f" ~{format_count(table_meta['row_estimate'])} rows"
+            schema_lines.append(line)
+    if starred:
+        schema_lines.append("* indexed; filter large tables on these")
     return "\n".join(schema_lines)
 
-# Embed and save to .pkl
-def embed_and_save():
+@dataclass
+class SchemaContext:
+    text: str
+    tokens: int
+    budget: int
+    # table -> columns that made it into the text
+    selection: dict
+    dropped_tables: list = field(default_factory=list)
+    dropped_columns: list = field(default_factory=list)
+
+# Everything one query reads, built together on reload and replaced as a whole, so a reload from another
+# thread never mixes keys from one load with matrices from another
+@dataclass(frozen=True, eq=False)
+class SchemaSnapshot:
+    schema: dict
+    lexical: LexicalIndex
+    joins: JoinGraph
+    table_keys: list
+    column_keys: list
+    column_descriptions: list
+    # Stores hold L2-normalized rows, so the memory-mapped matrices are scored as-is
+    table_matrix: np.ndarray
+    column_matrix: np.ndarray
+    # Column -> owning table position, so filtering by selected tables is a vector mask
+    column_table: np.ndarray
+
+    def top_tables(self, query_vec: np.ndarray, k: int) -> List[str]:
+        scores = self.table_matrix @ query_vec
+        return [self.table_keys[i] for i in top_k(scores, k)]
+
+    def top_columns(self, query_vec: np.ndarray, tables: List[str], k: int) -> List[Tuple[str, str]]:
+        table_pos = [self.table_keys.index(t) for t in tables]
+        candidates = np.flatnonzero(np.isin(self.column_table, table_pos))
+        if candidates.size == 0:
+            return []
+        scores = self.column_matrix[candidates] @ query_vec
+        return [self.column_keys[candidates[i]] for i in top_k(scores, k)]
+
+    def has_column(self, table: str, column: str) -> bool:
+        return column in self.schema["tables"].get(table, {}).get("columns", {})
+
+# Long-lived retrieval index: loads schema and embeddings once, reloads when the data files change
+class SchemaIndex:
+    def __init__(self, table_k: int = 5, column_k: int = 10):
+        self.table_k = table_k
+        self.column_k = column_k
+        self._lock = threading.Lock()
+        self._mtimes = None
+        self._snapshot = None
+        # How many questions were answered from the lexical index alone vs. fused with vector search
+        self.lexical_only = 0
+        self.hybrid = 0
+        self.reload()
+
+    @staticmethod
+    def _data_mtimes():
+        paths = (SCHEMA_PATH, *store_paths(COLUMN_EMBED_PATH), *store_paths(TABLE_EMBED_PATH))
+        return tuple(os.path.getmtime(path) if os.path.exists(path) else None for path in paths)
+
+    def reload(self):
+        with self._lock:
+            with open(SCHEMA_PATH, "r") as f:
+                schema = json.load(f)
+            table_store = load_table_embeddings()
+            column_store = load_column_embeddings()
+            table_pos = {t: i for i, t in enumerate(table_store.keys)}
+            # One assignment publishes the new snapshot; queries already running keep the one they took
+            self._snapshot = SchemaSnapshot(
+                schema=schema,
+                lexical=LexicalIndex(schema),
+                joins=JoinGraph(schema),
+                table_keys=table_store.keys,
+                column_keys=column_store.keys,
+                column_descriptions=column_store.descriptions,
+                table_matrix=table_store.matrix,
+                column_matrix=column_store.matrix,
+                column_table=np.array([table_pos.get(t, -1) for t, _ in column_store.keys], dtype=np.int64),
+            )
+            self._mtimes = self._data_mtimes()
+
+    def refresh_if_stale(self):
+        if self._data_mtimes() != self._mtimes:
+            self.reload()
+
+    # The current snapshot, reloaded first if the data files changed; a query takes it once and uses only it
+    def snapshot(self) -> SchemaSnapshot:
+        self.refresh_if_stale()
+        return self._snapshot
+
+    # Tables and columns named outright by aliases/patterns; the matched columns lead, then the rest of their tables
+    def lexical_selection(self, snapshot: SchemaSnapshot, lexical) -> Tuple[List[str], List[Tuple[str, str]]]:
+        tables = []
+        for entity in lexical.full_matches:
+            table = entity[0] if isinstance(entity, tuple) else entity
+            if table not in tables and table in snapshot.schema["tables"]:
+                tables.append(table)
+        tables = tables[:self.table_k]
+        columns = [e for e in lexical.full_matches
+                   if isinstance(e, tuple) and e[0] in tables and snapshot.has_column(*e)]
+        columns += [(t, c) for t in tables for c in snapshot.schema["tables"][t]["columns"] if (t, c) not in columns]
+        return tables, columns[:self.column_k]
+
+    # Alias/pattern matches for the query. Callers can check `confident` before embedding the question
+    # for anything else (the semantic cache), then hand the match to build_context so it isn't searched twice
+    def lexical_search(self, query: str, snapshot: SchemaSnapshot = None):
+        snapshot = snapshot or self.snapshot()
+        with span("retrieval.lexical") as record:
+            lexical = snapshot.lexical.search(query)
+            record["confident"] = lexical.confident
+        return lexical
+
+    # Filtering and "choosing tables and columns" logic using alias/pattern matches fused with cosine
+    # similarity; (tables, columns), each best first. A match handed in from before a reload only
+    # contributes the tables and columns the snapshot still has
+    def rank_schema(self, query: str, lexical=None,
+                    snapshot: SchemaSnapshot = None) -> Tuple[List[str], List[Tuple[str, str]]]:
+        snapshot = snapshot or self.snapshot()
+        if lexical is None:
+            lexical = self.lexical_search(query, snapshot)
+
+        if lexical.confident:
+            # The question names its schema outright, so skip the embedding call
+            self.lexical_only += 1
+            selected_tables, top_columns = self.lexical_selection(snapshot, lexical)
+        else:
+            self.hybrid += 1
+            query_vec = normalize_rows(embed_query(query))[0]
+            lexical_tables = [t for t in lexical.tables if t in snapshot.table_keys]
+            with span("retrieval.knn"):
+                vector_tables = snapshot.top_tables(query_vec, len(snapshot.table_keys))
+                selected_tables = reciprocal_rank_fusion([vector_tables, lexical_tables])[:self.table_k]
+
+## Use column descriptions and embeddings to match schema to query
+                vector_columns = snapshot.top_columns(query_vec, selected_tables, len(snapshot.column_keys))
+            lexical_columns = [c for c in lexical.columns if c[0] in selected_tables and snapshot.has_column(*c)]
+            top_columns = reciprocal_rank_fusion([vector_columns, lexical_columns])[:self.column_k]
+        return selected_tables, list(dict.fromkeys(top_columns))
+
+    # table -> columns for the chosen columns, tables in rank order, plus the bridge tables and join keys
+    # on the shortest paths connecting them
+    def with_joins(self, snapshot: SchemaSnapshot, tables: List[str], columns: List[Tuple[str, str]]) -> dict:
+        table_column_map = {table: [] for table in tables}
+        for t, c in columns:
+            table_column_map.setdefault(t, []).append(c)
+        table_column_map = {t: cols for t, cols in table_column_map.items() if cols}
+
+        for join in snapshot.joins.connect(list(table_column_map)):
+            for table, column in ((join.left, join.left_column), (join.right, join.right_column)):
+                columns = table_column_map.setdefault(table, [])
+                if column not in columns:
+                    columns.append(column)
+        return table_column_map
+
+    # Columns are added best first while the formatted context stays within the token budget (0 means
+    # unlimited); join keys for the kept tables always come along. The top column is kept even if it alone
+    # exceeds the budget, so the prompt never loses its schema entirely
+    def build_context(self, query: str, budget: int = CONTEXT_TOKEN_BUDGET,
+                      include_types: bool = CONTEXT_INCLUDE_TYPES,
+                      include_stats: bool = CONTEXT_INCLUDE_STATS, lexical=None) -> SchemaContext:
+        with span("retrieval") as record:
+            context = self._build_context(query, budget, include_types, include_stats, lexical)
+            record.update(tokens=context.tokens, tables=list(context.selection))
+        return context
+
+    def _build_context(self, query: str, budget: int, include_types: bool, include_stats: bool,
+                       lexical=None) -> SchemaContext:
+        snapshot = self.snapshot()
+        tables, ranked = self.rank_schema(query, lexical, snapshot)
+
+        def format_selection(selection: dict) -> str:
+            return format_schema_context(selection, snapshot.schema, include_types, include_stats)
+
+        if not ranked:
+            text = "No matching schema found."
+            return SchemaContext(text, estimate_tokens(text), budget, {}, tables, [])
+
+        kept, dropped = [], []
+        for column in ranked:
+            candidate = kept + [column]
+            text = format_selection(self.with_joins(snapshot, tables, candidate))
+            if kept and budget and estimate_tokens(text) > budget:
+                dropped.append(column)
+            else:
+                kept = candidate
+
+        selection = self.with_joins(snapshot, tables, kept)
+        text = format_selection(selection)
+        return SchemaContext(
+            text=text,
+            tokens=estimate_tokens(text),
+            budget=budget,
+            selection=selection,
+            dropped_tables=[t for t in dict.fromkeys([*tables, *(t for t, _ in ranked)]) if t not in selection],
+            # A dropped column can still be in the context as a join key
+            dropped_columns=[f"{t}.{c}" for t, c in dropped if c not in selection.get(t, [])],
+        )
+
+    def get_schema_context(self, query: str) -> str:
+        return self.build_context(query).text
+
+# One index per process, shared by the UI and CLI
+_schema_index = None
+_schema_index_lock = threading.Lock()
+
+def get_schema_index() -> SchemaIndex:
+    global _schema_index
+    with _schema_index_lock:
+        if _schema_index is None:
+            _schema_index = SchemaIndex()
+    return _schema_index
+
+def get_schema_context(query: str) -> str:
+    return get_schema_index().get_schema_context(query)
+
+# Embed and save to the embedding store, reusing vectors for unchanged descriptions unless full=True
+def embed_and_save(dtype: str = "float32", full: bool = False):
     print("Embedding columns with join-aware descriptions...")
     column_keys, column_descriptions = load_schema_for_columns()
-    column_embeddings = get_embeddings(column_descriptions)
-    with open(COLUMN_EMBED_PATH, "wb") as f:
-        pickle.dump((column_embeddings, column_keys, column_descriptions), f)
-    print(f"Saved column embeddings to {COLUMN_EMBED_PATH}")
+    _, summary = embed_incremental(COLUMN_EMBED_PATH, column_keys, column_descriptions, dtype=dtype, full=full)
+    print(f"Saved column embeddings to {COLUMN_EMBED_PATH}.npy ({dtype}): "
+          f"{summary['reused']} reused, {summary['added']} added, {summary['removed']} removed")
+    print("Embedding table descriptions...")
+    _, summary = embed_and_save_tables(dtype, full=full)
+    print(f"Saved table embeddings to {TABLE_EMBED_PATH}.npy ({dtype}): "
+          f"{summary['reused']} reused, {summary['added']} added, {summary['removed']} removed")
+    embedder = get_embedder()
+    print(f"Embedded {embedder.texts_embedded} texts with {embedder.backend}/{embedder.model} in {embedder.seconds:.2f}s "
+          f"({embedder.throughput():.1f} texts/s)")
+
+# Convert a legacy list-of-floats pickle into the column embedding store
+def convert_legacy_pickle(pkl_path: str = LEGACY_COLUMN_PKL_PATH, dtype: str = "float32"):
+    if _embedder.backend != "ollama":
+        raise ValueError("Legacy pickles hold Ollama embeddings; set EMBED_BACKEND=ollama to convert one")
+    store = convert_pickle(pkl_path, COLUMN_EMBED_PATH, MODEL_NAME, dtype=dtype, backend="ollama")
+    print(f"Converted {len(store)} embeddings from {pkl_path} to {COLUMN_EMBED_PATH}.npy ({dtype}, dim {store.dim})")
 
 if __name__ == "__main__":
     import sys
-    if len(sys.argv) == 2 and sys.argv[1] == "embed":
-        embed_and_save()
-    elif len(sys.argv) > 2 and sys.argv[1] == "ask":
-        query = " ".join(sys.argv[2:])
+    dtype = "float16" if "--float16" in sys.argv else "float32"
+    full = "--full" in sys.argv
+    argv = [a for a in sys.argv if a not in ("--float16", "--full")]
+    if len(argv) == 2 and argv[1] == "embed":
+        embed_and_save(dtype, full=full)
+    elif len(argv) in (2, 3) and argv[1] == "convert":
+        convert_legacy_pickle(*argv[2:], dtype=dtype)
+    elif len(argv) > 2 and argv[1] == "ask":
+        query = " ".join(argv[2:])
         print("\n Simulating retrieval for:", query)
-        print("\n" + get_schema_context(query))
+        context = get_schema_index().build_context(query)
+        print("\n" + context.text)
+        print(f"\n{context.tokens} tokens (budget {context.budget or 'none'})")
+        if context.dropped_tables or context.dropped_columns:
+            print(f"Dropped: {', '.join(context.dropped_tables + context.dropped_columns)}")
     else:
         print("Usage:")
-        print("  python schema_rag.py embed        # Embed and save column schema")
-        print("  python schema_rag.py ask <query>  # Retrieve schema context")
+        print("  python schema_rag.py embed [--float16] [--full] # Embed new/changed column and table descriptions")
+        print("  python schema_rag.py convert [pkl] [--float16]  # Convert a legacy .pkl column embedding file")
+        print("  python schema_rag.py ask <query>                # Retrieve schema context")
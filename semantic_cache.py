@@ -0,0 +1,275 @@
+## Semantic cache of question -> SQL translations that ran successfully, so paraphrases skip the LLM
+
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+import numpy as np
+from metrics import CACHE_LOOKUPS
+from tracing import span, trace_kwargs
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", "data/semantic_sql_cache.json")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "500"))
+# Hit counts and last-used times are kept in memory and written at most this often (adds and purges save at once)
+SEMANTIC_CACHE_FLUSH_SECONDS = float(os.getenv("SEMANTIC_CACHE_FLUSH_SECONDS", "60"))
+
+# SQLSTATEs of a statement that can never run as written: syntax error, undefined table, column, function
+# or schema, ambiguous column. Busy, timeout and connection errors leave a cached SQL in place
+INVALID_SQLSTATES = {"42601", "42P01", "42703", "42883", "3F000", "42702"}
+
+SQL_LITERAL = re.compile(r"'((?:[^']|'')*)'|\b(\d+(?:\.\d+)?)\b")
+NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+# Row limits, intervals and positional GROUP/ORDER BY shape the result rather than pick the subject,
+# so they needn't come from the question
+STRUCTURAL_LITERAL = re.compile(
+    r"\b(?:limit|offset)\s+\d+|\binterval\s+'[^']*'|\b(?:group|order)\s+by\s+\d+(?:\s+(?:asc|desc))?(?:\s*,\s*\d+(?:\s+(?:asc|desc))?)*",
+    re.IGNORECASE,
+)
+
+
+# Literals in the SQL that were copied from the question (repo ids, names...); None if some literal
+# came from elsewhere, e.g. a repo_id the agent looked up first, since the SQL can't be reused safely then
+def question_parameters(question: str, sql: str):
+    text = question.lower()
+    params = []
+    for quoted, number in SQL_LITERAL.findall(STRUCTURAL_LITERAL.sub(" ", sql)):
+        value = (quoted.replace("''", "'") if quoted else number).lower()
+        if not value:
+            continue
+        found = re.search(rf"\b{re.escape(value)}\b", text) if number else value in text
+        if not found:
+            return None
+        if value not in params:
+            params.append(value)
+    return params
+
+
+# A cached SQL only fits a new question that carries the same parameters and no different numbers
+def parameters_match(entry: dict, question: str) -> bool:
+    text = question.lower()
+    if sorted(NUMBER.findall(text)) != sorted(NUMBER.findall(entry["question"].lower())):
+        return False
+    return all(param in text for param in entry["params"])
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticSQLCache:
+    def __init__(self, path: str = SEMANTIC_CACHE_PATH, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 max_size: int = SEMANTIC_CACHE_SIZE, flush_seconds: float = SEMANTIC_CACHE_FLUSH_SECONDS):
+        self.path = path or None
+        self.threshold = threshold
+        self.max_size = max_size
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self.entries = []
+        self.hits = 0
+        self.misses = 0
+        if self.path and os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)["entries"]
+        # (model, dim) -> (entry positions, embedding matrix), built lazily
+        self._matrices = {}
+        # Hit metadata changed since the last write
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        if self.path:
+            atexit.register(self.flush)
+
+    def _save(self):
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"entries": self.entries}, f)
+        os.replace(tmp_path, self.path)
+
+    # Entries embedded by one model at one dimension; vectors from another embedder can't be scored against them
+    def _embeddings(self, model: str, dim: int) -> tuple:
+        key = (model, dim)
+        if key not in self._matrices:
+            positions = [i for i, e in enumerate(self.entries) if e["model"] == model and len(e["embedding"]) == dim]
+            matrix = np.array([self.entries[i]["embedding"] for i in positions], dtype=np.float32).reshape(-1, dim)
+            self._matrices[key] = (positions, matrix)
+        return self._matrices[key]
+
+    # Best stored entry above the similarity threshold whose parameters match, or None
+    def lookup(self, question: str, embedding, model: str):
+        with self._lock:
+            query = _unit(embedding)
+            positions, matrix = self._embeddings(model, len(query))
+            scores = matrix @ query
+            for i in np.argsort(-scores):
+                if scores[i] < self.threshold:
+                    break
+                entry = self.entries[positions[i]]
+                if parameters_match(entry, question):
+                    entry["last_used"] = time.time()
+                    entry["hits"] += 1
+                    self.hits += 1
+                    # Only metadata changed, so the embedding matrices stay valid and the file can wait
+                    self._dirty = True
+                    if time.monotonic() - self._saved_at >= self.flush_seconds:
+                        self._save()
+                    return {**entry, "similarity": float(scores[i])}
+            self.misses += 1
+            return None
+
+    def add(self, question: str, embedding, model: str, sql: str) -> bool:
+        params = question_parameters(question, sql)
+        if params is None:
+            return False
+        now = time.time()
+        with self._lock:
+            # One entry per SQL: a newer phrasing replaces the old one
+            self.entries = [e for e in self.entries if e["sql"] != sql]
+            self.entries.append({
+                "question": question,
+                "model": model,
+                "embedding": _unit(embedding).tolist(),
+                "sql": sql,
+                "params": params,
+                "created_at": now,
+                "last_used": now,
+                "hits": 0,
+            })
+            # Least recently used entries go first
+            if len(self.entries) > self.max_size:
+                self.entries.sort(key=lambda e: e["last_used"])
+                self.entries = self.entries[-self.max_size:]
+            self._matrices = {}
+            self._save()
+        return True
+
+    # Drop every entry for a SQL statement that has since failed
+    def purge(self, sql: str) -> int:
+        with self._lock:
+            before = len(self.entries)
+            self.entries = [e for e in self.entries if e["sql"] != sql]
+            removed = before - len(self.entries)
+            if removed:
+                self._matrices = {}
+                self._save()
+            return removed
+
+    # Write pending hit metadata; also runs at interpreter exit
+    def flush(self):
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.entries),
+                    "max_size": self.max_size, "threshold": self.threshold}
+
+
+def _content_text(content) -> str:
+    if isinstance(content, str):
+        return content
+    return "".join(getattr(item, "text", "") for item in content or [])
+
+
+def _tool_succeeded(text: str) -> bool:
+    try:
+        result = json.loads(text)
+    except ValueError:
+        return False
+    return not (isinstance(result, dict) and "error" in result)
+
+
+def _sql_invalid(text: str) -> bool:
+    try:
+        result = json.loads(text)
+    except ValueError:
+        return False
+    return isinstance(result, dict) and result.get("sqlstate") in INVALID_SQLSTATES
+
+
+# Pass an agent turn stream through unchanged while keeping every chunk for inspection afterwards
+def record_chunks(turn, chunks: list):
+    for chunk in turn:
+        chunks.append(chunk)
+        yield chunk
+
+
+# (tool name, arguments, response text or None) for each tool call the agent made during a streamed turn
+def tool_calls(chunks: list) -> list[tuple]:
+    calls = []
+    for chunk in chunks:
+        payload = getattr(getattr(chunk, "event", None), "payload", None)
+        if getattr(payload, "event_type", None) != "step_complete" or payload.step_type != "tool_execution":
+            continue
+        responses = {r.call_id: r for r in payload.step_details.tool_responses}
+        for call in payload.step_details.tool_calls:
+            arguments = call.arguments
+            if isinstance(arguments, str):
+                arguments = json.loads(arguments or "{}")
+            response = responses.get(call.call_id)
+            calls.append((call.tool_name, arguments, None if response is None else _content_text(response.content)))
+    return calls
+
+
+# (sql, succeeded, invalid) for each execute_query call the agent made during a streamed turn
+def executed_sql(chunks: list) -> list[tuple]:
+    return [(arguments["sql"], text is not None and _tool_succeeded(text), text is not None and _sql_invalid(text))
+            for tool, arguments, text in tool_calls(chunks)
+            if tool == "execute_query" and arguments.get("sql")]
+
+
+# Re-run a cached translation through the tool runtime; None if it fails, and the entry is purged if the
+# SQL itself is no longer valid
+def run_cached_sql(client, cache: SemanticSQLCache, question: str, embedding, model: str):
+    entry = cache.lookup(question, embedding, model)
+    CACHE_LOOKUPS.inc(cache="semantic_sql", result="miss" if entry is None else "hit")
+    if entry is None:
+        return None
+    start = time.perf_counter()
+    try:
+        with span("semantic_cache.run", similarity=entry["similarity"]):
+            response = client.tool_runtime.invoke_tool(tool_name="execute_query",
+                                                       kwargs={"sql": entry["sql"], "summarize": False, **trace_kwargs()})
+        text = _content_text(response.content)
+        succeeded = not response.error_message and _tool_succeeded(text)
+    except Exception as e:
+        logger.warning(f"Cached SQL failed to run: {e}")
+        return None
+    if not succeeded:
+        if _sql_invalid(text):
+            logger.warning(f"Cached SQL is no longer valid, purging it: {entry['sql']}")
+            cache.purge(entry["sql"])
+        else:
+            logger.warning(f"Cached SQL failed, keeping it: {text}")
+        return None
+    return {
+        "sql": entry["sql"],
+        "matched_question": entry["question"],
+        "similarity": entry["similarity"],
+        "result": json.loads(text),
+        "latency_ms": 1000 * (time.perf_counter() - start),
+    }
+
+
+# Remember the last SQL the agent ran successfully and purge any cached SQL that turned out to be invalid
+def learn_from_turn(cache: SemanticSQLCache, question: str, embedding, model: str, chunks: list):
+    calls = executed_sql(chunks)
+    for sql, succeeded, invalid in calls:
+        if invalid:
+            cache.purge(sql)
+    successful = [sql for sql, succeeded, invalid in calls if succeeded]
+    if successful:
+        cache.add(question, embedding, model, successful[-1])
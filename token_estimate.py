@@ -0,0 +1,9 @@
+## Token estimate shared by the schema context budget and the tool result budget
+
+import re
+
+
+# Rough token count (letter runs, digits and punctuation each count as one); close enough to compare
+# context sizes without pulling in the model's tokenizer
+def estimate_tokens(text: str) -> int:
+    return len(re.findall(r"[A-Za-z]+|\d|[^\sA-Za-z\d]", text))
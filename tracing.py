@@ -0,0 +1,118 @@
+## Per-question tracing - timed spans that share one trace id from the UI/CLI through the MCP tool calls
+
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from metrics import STAGE_SECONDS
+from dotenv import load_dotenv
+load_dotenv()
+
+# JSONL file that every finished span is appended to, for offline analysis; empty to disable
+TRACE_PATH = os.getenv("TRACE_PATH", "")
+
+# (trace_id, span_id) of the innermost open span in this thread / task
+_current = contextvars.ContextVar("augur_span", default=None)
+# trace_id -> list collecting that trace's finished spans, while a trace() block is open in this process
+_collectors = {}
+_lock = threading.Lock()
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def current_trace_id():
+    current = _current.get()
+    return current[0] if current else None
+
+
+# Tool kwargs that carry the current trace id into an MCP call (empty outside a trace)
+def trace_kwargs() -> dict:
+    trace_id = current_trace_id()
+    return {"trace_id": trace_id} if trace_id else {}
+
+
+def _emit(record: dict):
+    STAGE_SECONDS.observe(record["duration_ms"] / 1000, stage=record["name"])
+    with _lock:
+        collector = _collectors.get(record["trace_id"])
+        if collector is not None:
+            collector.append(record)
+        if TRACE_PATH:
+            with open(TRACE_PATH, "a") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+
+
+# Time a block as a span of the current trace (or of trace_id, e.g. one received by an MCP tool).
+# The yielded dict is the span record; add attributes to it inside the block
+@contextmanager
+def span(name: str, trace_id: str = None, **attributes):
+    parent = _current.get()
+    trace_id = trace_id or (parent[0] if parent else new_trace_id())
+    span_id = uuid.uuid4().hex[:8]
+    record = {
+        "trace_id": trace_id,
+        "span_id": span_id,
+        "parent_id": parent[1] if parent and parent[0] == trace_id else None,
+        "name": name,
+        "start": time.time(),
+        **attributes,
+    }
+    token = _current.set((trace_id, span_id))
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record["error"] = repr(e)
+        raise
+    finally:
+        record["duration_ms"] = round(1000 * (time.perf_counter() - start), 2)
+        _current.reset(token)
+        _emit(record)
+
+
+# Record a stage that was timed elsewhere (e.g. the SQL part of a streamed agent turn) as a child of the current span
+def record_span(name: str, duration_ms: float, **attributes):
+    parent = _current.get()
+    if parent is None:
+        return
+    _emit({
+        "trace_id": parent[0],
+        "span_id": uuid.uuid4().hex[:8],
+        "parent_id": parent[1],
+        "name": name,
+        "start": time.time() - duration_ms / 1000,
+        "duration_ms": round(duration_ms, 2),
+        **attributes,
+    })
+
+
+class Trace:
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans = []
+
+    # Total milliseconds per span name, in the order the stages finished
+    def stage_totals(self) -> dict:
+        totals = {}
+        for record in self.spans:
+            totals[record["name"]] = totals.get(record["name"], 0.0) + record["duration_ms"]
+        return totals
+
+
+# Root span for one question; collects every span of the trace finished in this process
+@contextmanager
+def trace(name: str = "question", trace_id: str = None, **attributes):
+    current = Trace(trace_id or new_trace_id())
+    with _lock:
+        _collectors[current.trace_id] = current.spans
+    try:
+        with span(name, trace_id=current.trace_id, **attributes):
+            yield current
+    finally:
+        with _lock:
+            _collectors.pop(current.trace_id, None)
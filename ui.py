@@ -8,8 +8,14 @@ import logging
 import os
 from dotenv import load_dotenv
 import json
-from schema_rag import get_schema_context
+from schema_rag import MODEL_NAME, embed_query, get_schema_index
+from intent_router import run_fast_path
+from semantic_cache import SemanticSQLCache, learn_from_turn, record_chunks, run_cached_sql
+from metrics import METRICS_PORT, serve_metrics
+from result_encoding import result_rows
+from tracing import record_span, trace
 import re
+import time
 
 # Streamlit Page Config
 st.set_page_config(page_title="Augur SQL Assistant", layout="wide")
@@ -26,11 +32,12 @@ formatter = logging.Formatter('%(message)s')
 stream_handler.setFormatter(formatter)
 logger.addHandler(stream_handler)
 
-# Load .env and Connect
+# Load .env
 load_dotenv()
 base_url = os.getenv("BASE_URL")
-client = LlamaStackClient(base_url=base_url)
 request_timeout=int(os.getenv("LLM_TIMEOUT", "120"))
+# Minimum seconds between redraws of the streamed LLM output
+render_interval = float(os.getenv("UI_RENDER_INTERVAL", "0.1"))
 
 # LLM Instructions
 instructions = """
@@ -55,23 +62,126 @@ DO NOT:
 - Do not use any other tools besides `execute_query`
 """
 
-agent = Agent(
-    client=client,
-    model="llama3.2:3b-instruct-fp16",
-    instructions=instructions,
-    tools=["mcp::execute"],
-    tool_config={"tool_choice": "auto"},
-    sampling_params={"max_tokens": 4096, "strategy": {"type": "greedy", "temperature": 0.0}},
-)
-session_id = agent.create_session("StreamlitSession")
+# Streamlit reruns this script on every interaction; these are built once per server process
+@st.cache_resource
+def get_client():
+    return LlamaStackClient(base_url=base_url)
+
+@st.cache_resource
+def get_agent():
+    return Agent(
+        client=get_client(),
+        model="llama3.2:3b-instruct-fp16",
+        instructions=instructions,
+        tools=["mcp::execute"],
+        tool_config={"tool_choice": "auto"},
+        sampling_params={"max_tokens": 4096, "strategy": {"type": "greedy", "temperature": 0.0}},
+    )
+
+@st.cache_resource
+def get_cached_schema_index():
+    return get_schema_index()
+
+@st.cache_resource
+def get_sql_cache():
+    return SemanticSQLCache()
+
+# Retrieval and embedding metrics live in this process, so they get their own scrape endpoint
+@st.cache_resource
+def start_metrics_server():
+    return serve_metrics(int(METRICS_PORT)) if METRICS_PORT else None
+
+client = get_client()
+agent = get_agent()
+schema_index = get_cached_schema_index()
+sql_cache = get_sql_cache()
+start_metrics_server()
+
+# One agent session per browser session, so conversations don't share history
+if "session_id" not in st.session_state:
+    st.session_state.session_id = agent.create_session("StreamlitSession")
+session_id = st.session_state.session_id
+
+# Rows from a tool result envelope (row or columnar payload) as a table; a summary shows its statistics
+def show_rows(result):
+    if isinstance(result, dict) and result.get("format") == "summary":
+        st.info(result["note"])
+        st.dataframe(pd.DataFrame(result["summary"]).T)
+    rows = result_rows(result)
+    if rows:
+        st.dataframe(pd.DataFrame(rows))
+    else:
+        st.info("No matching rows.")
+
+# " · cached 42 s ago" when the MCP server answered from its result cache
+def freshness(result) -> str:
+    if isinstance(result, dict) and result.get("cached"):
+        return f" · cached {result.get('cache_age_seconds', 0):.0f} s ago"
+    return ""
+
+# Elapsed time per stage, shown as a single caption line
+def show_timings(placeholder, timings: dict):
+    placeholder.caption(" · ".join(f"{stage} {seconds:.2f} s" for stage, seconds in timings.items()))
+
+# Pass the turn stream through while timing each tool execution step (the SQL calls) as it happens
+def time_tool_steps(turn, timings: dict):
+    tool_started = None
+    for chunk in turn:
+        payload = getattr(getattr(chunk, "event", None), "payload", None)
+        if getattr(payload, "step_type", None) == "tool_execution":
+            if payload.event_type == "step_start":
+                tool_started = time.perf_counter()
+            elif payload.event_type == "step_complete" and tool_started is not None:
+                timings["SQL"] = timings.get("SQL", 0.0) + time.perf_counter() - tool_started
+                tool_started = None
+        yield chunk
 
 # main.py logic, reformatted with streamlit
 user_input = st.text_input(" Ask a question:", placeholder="e.g., Count contributors per repo with over 1000 contributors")
 show_sql = st.checkbox("🔍 Show SQL Query")
+use_fast_path = st.checkbox("⚡ Answer known questions without the LLM", value=True)
 
 if st.button("Submit") and user_input:
-    with st.spinner("Thinking..."):
-        context_str = get_schema_context(user_input)
+    # Every span of this question, including the MCP tool calls, shares the trace id
+    with st.spinner("Thinking..."), trace("question", question=user_input) as question_trace:
+        # Known question shapes go straight to a templated MCP tool
+        fast_path = run_fast_path(client, user_input) if use_fast_path else None
+        if fast_path:
+            logger.info(f"route=fast_path tool={fast_path['route']} args={fast_path['args']} latency_ms={fast_path['latency_ms']:.0f} "
+                        f"trace_id={question_trace.trace_id}")
+            st.caption(f"Route: fast path · `{fast_path['route']}({fast_path['args']})` · {fast_path['latency_ms']:.0f} ms"
+                       f"{freshness(fast_path['result'])} · trace {question_trace.trace_id}")
+            st.markdown("### Final Answer")
+            show_rows(fast_path["result"])
+            st.stop()
+
+        # A question that names its schema outright is answered without any embedding call, so it also
+        # skips the semantic cache; other paraphrases of questions the agent already answered reuse its SQL
+        lexical = schema_index.lexical_search(user_input)
+        question_embedding = None if lexical.confident else embed_query(user_input)
+        cached_sql = (run_cached_sql(client, sql_cache, user_input, question_embedding, MODEL_NAME)
+                      if use_fast_path and question_embedding is not None else None)
+        if cached_sql:
+            logger.info(f"route=semantic_cache similarity={cached_sql['similarity']:.3f} latency_ms={cached_sql['latency_ms']:.0f} "
+                        f"trace_id={question_trace.trace_id}")
+            st.caption(f"Route: semantic cache · matched \"{cached_sql['matched_question']}\" "
+                       f"(similarity {cached_sql['similarity']:.2f}) · {cached_sql['latency_ms']:.0f} ms"
+                       f"{freshness(cached_sql['result'])} · trace {question_trace.trace_id}")
+            if show_sql:
+                st.markdown("### SQL Query")
+                st.code(cached_sql["sql"], language="sql")
+            st.markdown("### Final Answer")
+            show_rows(cached_sql["result"])
+            st.stop()
+
+        agent_start = time.perf_counter()
+        timings = {}
+        timings_placeholder = st.empty()
+        retrieval_start = time.perf_counter()
+        schema_context = schema_index.build_context(user_input, lexical=lexical)
+        context_str = schema_context.text
+        timings["Retrieval"] = time.perf_counter() - retrieval_start
+        show_timings(timings_placeholder, timings)
 
         full_prompt = f"""
 You may use the following schema context to answer the user's question.
@@ -82,43 +192,59 @@ User question: {user_input}
 
         # Show context block
         st.markdown("### Schema Context")
-        st.markdown(
-            f"<div style='background-color:#f8f9fa; padding:10px; border-radius:8px'><pre>{context_str}</pre></div>",
-            unsafe_allow_html=True
-        )
+        st.code(context_str, language=None)
+        dropped = schema_context.dropped_tables + schema_context.dropped_columns
+        st.caption(f"{schema_context.tokens} tokens (budget {schema_context.budget or 'none'})"
+                   + (f" · dropped {', '.join(dropped)}" if dropped else ""))
 
         # Show prompt
         st.markdown("### Prompt Sent to LLM")
-        st.markdown(
-            f"<div style='background-color:#f0f0f0; padding:10px; border-radius:8px'><pre>{full_prompt.strip()}</pre></div>",
-            unsafe_allow_html=True
-        )
+        st.code(full_prompt.strip(), language=None)
 
         # Get response
         st.markdown("### LLM Response")
         output_container = st.empty()
-        full_response = ""
+        response_parts = []
         final_response_triggered = False
 
+        llm_start = time.perf_counter()
+        last_render = 0.0
+        # Toolgroup args are merged into every MCP tool call of the turn, carrying the trace id to the server
         turn = agent.create_turn(
             session_id=session_id,
             messages=[{"role": "user", "content": full_prompt}],
+            toolgroups=[{"name": "mcp::execute", "args": {"trace_id": question_trace.trace_id}}],
             stream=True
         )
 
-        for log in EventLogger().log(turn):
+        turn_chunks = []
+        for log in EventLogger().log(time_tool_steps(record_chunks(turn, turn_chunks), timings)):
             if log.content:
-                full_response += log.content
-                output_container.markdown(
-                    f"<div style='background-color:#e8f5e9; padding:10px; border-radius:8px;'><pre>{full_response}</pre></div>",
-                    unsafe_allow_html=True
-                )
+                response_parts.append(log.content)
 
                 # Stop if final response detected
                 if re.match(r"^(Response|The\s)", log.content.strip()):
                     final_response_triggered = True
                     break
 
+                # Redraw at most every render_interval seconds rather than on every token
+                now = time.perf_counter()
+                if now - last_render >= render_interval:
+                    output_container.code("".join(response_parts), language=None)
+                    timings["LLM"] = now - llm_start - timings.get("SQL", 0.0)
+                    show_timings(timings_placeholder, timings)
+                    last_render = now
+
+        full_response = "".join(response_parts)
+        output_container.code(full_response, language=None)
+        timings["LLM"] = time.perf_counter() - llm_start - timings.get("SQL", 0.0)
+        show_timings(timings_placeholder, timings)
+        record_span("llm", 1000 * timings["LLM"])
+        record_span("agent.tools", 1000 * timings.get("SQL", 0.0))
+
+        if question_embedding is not None:
+            learn_from_turn(sql_cache, user_input, question_embedding, MODEL_NAME, turn_chunks)
+
         # Parse and display extracted SQL
         if show_sql:
             st.markdown("### SQL Query")
@@ -142,3 +268,7 @@ User question: {user_input}
                 st.write(raw_json)
         else:
             st.info("Could not extract a clear final answer. Please check the LLM response.")
+
+        agent_ms = 1000 * (time.perf_counter() - agent_start)
+        logger.info(f"route=agent latency_ms={agent_ms:.0f} trace_id={question_trace.trace_id}")
+        st.caption(f"Route: agent · {agent_ms / 1000:.1f} s · trace {question_trace.trace_id}")